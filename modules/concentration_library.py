@@ -209,4 +209,560 @@ def kolm(vector, alpha):
 
 def mad(vector):
     mean = np.mean(vector)
-    return np.mean(np.abs(vector - mean))
\ No newline at end of file
+    return np.mean(np.abs(vector - mean))
+
+# Batched variants: every index for each row of an array (along axis) or
+# for each group of a flat array (groups gives the group id of every
+# element, results are in the order of np.unique(groups)). The computation
+# is that of the scalar functions, done for all rows at once.
+
+def _batch(rows_index, vector, axis, groups, *args):
+    vector = np.asarray(vector, dtype=float)
+    if groups is None:
+        return rows_index(np.ascontiguousarray(np.moveaxis(vector, axis, -1)), *args)
+
+    # Groups of the same size are stacked into one 2-D array
+    keys, inverse, counts = np.unique(groups, return_inverse=True, return_counts=True)
+    grouped = vector[np.argsort(inverse.ravel(), kind='stable')]
+    starts = np.cumsum(counts) - counts
+    result = None
+    for size in np.unique(counts):
+        sel = np.flatnonzero(counts == size)
+        index = rows_index(grouped[starts[sel][:, None] + np.arange(size)], *args)
+        if result is None:
+            result = np.empty((keys.size,) + index.shape[1:])
+        result[sel] = index
+    return result
+
+
+def _get_row_weights(rows):
+    ts = rows.sum(axis=-1, keepdims=True)
+    if (ts <= 0).any():
+        raise TypeError('Vector must be positive')
+    return rows / ts
+
+
+def _sum_nz(terms, weights):
+    """Sum of terms over the last axis where weights are not 0, in the
+    order of the scalar functions (rows with as many non-zero weights
+    are summed together).
+    """
+    nz = weights != 0
+    if nz.all():
+        return terms.sum(axis=-1)
+    n = nz.sum(axis=-1)
+    terms = np.take_along_axis(terms, np.argsort(~nz, axis=-1, kind='stable'), axis=-1)
+    h = np.empty(n.shape)
+    for size in np.unique(n):
+        sel = n == size
+        h[sel] = terms[sel][..., :size].sum(axis=-1)
+    return h
+
+
+def _log_nz(weights):
+    return np.log(np.where(weights != 0, weights, 1))
+
+
+def _sort_desc(rows):
+    return -np.sort(-rows, axis=-1)
+
+
+def cr_batch(vector, n, axis=-1, groups=None):
+    """ Calculate the concentration ratio of every row or group
+    :param vector: Positive array
+    :param n: Integer
+    :param axis: Axis of the vectors
+    :param groups: Group ids of the elements of a flat vector
+    :return: Concentration Ratios (Array)
+    """
+    return _batch(_cr_rows, vector, axis, groups, n)
+
+
+def _cr_rows(rows, n):
+    if n < 0 or n > rows.shape[-1]:
+        raise TypeError('n must be an positive integer smaller than the vector size')
+    return _get_row_weights(_sort_desc(rows))[..., :n].sum(axis=-1)
+
+
+def berger_parker_batch(vector, axis=-1, groups=None):
+    """ Calculate the Berger Parker index of every row or group (see cr_batch) """
+    return cr_batch(vector, 1, axis, groups)
+
+
+def hhi_batch(vector, axis=-1, groups=None):
+    """ Calculate the Hirschman-Herfindahl index of every row or group (see cr_batch) """
+    return _batch(_hhi_rows, vector, axis, groups)
+
+
+def _hhi_rows(rows):
+    weights = _get_row_weights(rows)
+    n = weights.shape[-1]
+    return (np.square(weights).sum(axis=-1) - 1.0 / n) / (1.0 - 1.0 / n)
+
+
+def hk_batch(vector, a, axis=-1, groups=None):
+    """ Calculate the inverted Hannah Kay index of every row or group (see cr_batch) """
+    return _batch(_hk_rows, vector, axis, groups, a)
+
+
+def _hk_rows(rows, a):
+    weights = _get_row_weights(rows)
+    if a <= 0:
+        raise TypeError('Alpha must be strictly positive')
+    elif a == 1:
+        return np.exp(_sum_nz(weights * _log_nz(weights), weights))
+    else:
+        return np.power(np.power(weights, a).sum(axis=-1), 1.0/(a-1.0))
+
+
+def gini_batch(vector, axis=-1, groups=None):
+    """ Calculate the Gini index of every row or group (see cr_batch) """
+    return _batch(_gini_rows, vector, axis, groups)
+
+
+def _gini_rows(rows):
+    weights = _get_row_weights(_sort_desc(rows))
+    n = weights.shape[-1]
+    i = np.arange(1, n+1)
+    return (1.0 - 2.0 * np.multiply(i, weights).sum(axis=-1))/n + 1.0
+
+
+def gini_popadj_batch(vector, axis=-1, groups=None):
+    """ Population-size adjusted Gini of every row or group (see gini_popadj) """
+    return _batch(_gini_popadj_rows, vector, axis, groups)
+
+
+def _gini_popadj_rows(rows):
+    n = rows.shape[-1]
+    return _gini_rows(rows) * n / (n - 1)
+
+
+def shannon_batch(vector, axis=-1, groups=None):
+    """ Calculate the Shannon entropy index of every row or group (see cr_batch) """
+    return _batch(_shannon_rows, vector, axis, groups)
+
+
+def _shannon_rows(rows):
+    weights = _get_row_weights(rows)
+    n = (weights != 0).sum(axis=-1)
+    h = - _sum_nz(weights * _log_nz(weights), weights)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(n == 0, 0, 1.0 - h / np.log(n))
+
+
+def atkinson_batch(vector, epsilon, axis=-1, groups=None):
+    """ Calculate the Atkinson inequality index of every row or group (see cr_batch) """
+    return _batch(_atkinson_rows, vector, axis, groups, epsilon)
+
+
+def _atkinson_rows(rows, epsilon):
+    weights = _get_row_weights(rows)
+    n = weights.shape[-1]
+    if epsilon < 0:
+        raise TypeError('Epsilon must be strictly positive')
+    elif epsilon == 1:
+        n = (weights != 0).sum(axis=-1)
+        h = _sum_nz(_log_nz(weights), weights) / n
+        return 1 - n * np.exp(h)
+    else:
+        n2 = np.power(n, epsilon / (epsilon - 1.0))
+        h1 = np.power(weights, 1.0 - epsilon).sum(axis=-1)
+        return 1 - n2 * np.power(h1, 1.0/(1.0 - epsilon))
+
+
+def gei_batch(vector, alpha, axis=-1, groups=None):
+    """ Calculate the Generalized Entropy Index of every row or group (see cr_batch) """
+    return _batch(_gei_rows, vector, axis, groups, alpha)
+
+
+def _gei_rows(rows, alpha):
+    weights = _get_row_weights(rows)
+    n = weights.shape[-1]
+    if alpha == 0:
+        n = (weights != 0).sum(axis=-1)
+        return - (np.log(n) + _sum_nz(_log_nz(weights), weights) / n)
+    elif alpha == 1:
+        n = (weights != 0).sum(axis=-1)
+        return np.log(n) + _sum_nz(weights * _log_nz(weights), weights)
+    else:
+        n2 = np.power(n, alpha)
+        h1 = n2 * np.power(weights, alpha).sum(axis=-1) - n
+        return h1 / n / alpha / (alpha - 1.0)
+
+
+def theil_batch(vector, axis=-1, groups=None):
+    """ Calculate the Theil Index of every row or group (see cr_batch) """
+    return _batch(_theil_rows, vector, axis, groups)
+
+
+def _theil_rows(rows):
+    return _gei_rows(_get_row_weights(rows), 1)
+
+
+def kolm_batch(vector, alpha, axis=-1, groups=None):
+    """ Calculate the Kolm index of every row or group (see cr_batch) """
+    return _batch(_kolm_rows, vector, axis, groups, alpha)
+
+
+def _kolm_rows(rows, alpha):
+    n = rows.shape[-1]
+    if n == 0:
+        return np.zeros(rows.shape[:-1])
+    mu = rows.mean(axis=-1, keepdims=True)
+    weights = _get_row_weights(rows)
+    h = np.exp(np.multiply(- n * mu * alpha, weights)).sum(axis=-1)
+    return mu[..., 0] + (np.log(h) - np.log(n)) / alpha
+
+
+def mad_batch(vector, axis=-1, groups=None):
+    """ Mean absolute deviation of every row or group (see cr_batch) """
+    return _batch(_mad_rows, vector, axis, groups)
+
+
+def _mad_rows(rows):
+    mean = rows.mean(axis=-1, keepdims=True)
+    return np.abs(rows - mean).mean(axis=-1)
+
+
+# Indices of inequality_profile by default
+PROFILE = ['gini', 'gini_popadj', 'theil', ('atkinson', 0.5), ('cr', 1)]
+
+# Indices that need the vectors sorted
+SORTED_INDICES = ['cr', 'berger_parker', 'gini', 'gini_popadj']
+
+
+def inequality_profile(vector, indices=PROFILE, axis=-1, groups=None):
+    """ Calculate several indices of the same vectors in one pass: the sort
+    (if needed), total, weights and log-weights are computed once and shared.
+    Equal to the single index functions up to rounding (the total is taken
+    over the sorted vector).
+    :param vector: Positive vector, array of vectors along axis, or flat vector with groups
+    :param indices: Index names, or (name, parameter) for indices with a parameter
+    :param axis: Axis of the vectors
+    :param groups: Group ids of the elements of a flat vector (see cr_batch)
+    :return: Dict of index (name, or name_parameter) -> Float or Array
+    """
+    indices = [i if isinstance(i, tuple) else (i,) for i in indices]
+    result = _batch(_profile_rows, vector, axis, groups, indices)
+    names = ['_'.join(str(j) for j in i) for i in indices]
+    return {name: result[..., k] if result.ndim > 1 else float(result[k])
+            for k, name in enumerate(names)}
+
+
+def _profile_rows(rows, indices):
+    if any(i[0] in SORTED_INDICES for i in indices):
+        rows = _sort_desc(rows)
+    n = rows.shape[-1]
+    ts = rows.sum(axis=-1, keepdims=True)
+    if (ts <= 0).any():
+        raise TypeError('Vector must be positive')
+    weights = rows / ts
+    nz = weights != 0
+    n_nz = nz.sum(axis=-1)
+    log_weights = _log_nz(weights)
+    entropy = _sum_nz(weights * log_weights, weights)
+
+    profile = []
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for name, *params in indices:
+            if name in ['gini', 'gini_popadj']:
+                index = (1.0 - 2.0 * np.multiply(np.arange(1, n+1), weights).sum(axis=-1))/n + 1.0
+                if name == 'gini_popadj':
+                    index = index * n / (n - 1)
+            elif name in ['cr', 'berger_parker']:
+                k = params[0] if params else 1
+                if k < 0 or k > n:
+                    raise TypeError('n must be an positive integer smaller than the vector size')
+                index = weights[..., :k].sum(axis=-1)
+            elif name == 'hhi':
+                index = (np.square(weights).sum(axis=-1) - 1.0 / n) / (1.0 - 1.0 / n)
+            elif name == 'hk':
+                a = params[0]
+                if a <= 0:
+                    raise TypeError('Alpha must be strictly positive')
+                index = (np.exp(entropy) if a == 1 else
+                         np.power(np.power(weights, a).sum(axis=-1), 1.0/(a-1.0)))
+            elif name == 'shannon':
+                index = np.where(n_nz == 0, 0, 1.0 + entropy / np.log(n_nz))
+            elif name == 'atkinson':
+                epsilon = params[0]
+                if epsilon < 0:
+                    raise TypeError('Epsilon must be strictly positive')
+                elif epsilon == 1:
+                    index = 1 - n_nz * np.exp(_sum_nz(log_weights, weights) / n_nz)
+                else:
+                    h1 = np.power(weights, 1.0 - epsilon).sum(axis=-1)
+                    index = 1 - np.power(n, epsilon / (epsilon - 1.0)) * np.power(h1, 1.0/(1.0 - epsilon))
+            elif name in ['gei', 'theil']:
+                alpha = params[0] if params else 1
+                if alpha == 0:
+                    index = - (np.log(n_nz) + _sum_nz(log_weights, weights) / n_nz)
+                elif alpha == 1:
+                    index = np.log(n_nz) + entropy
+                else:
+                    h1 = np.power(n, alpha) * np.power(weights, alpha).sum(axis=-1) - n
+                    index = h1 / n / alpha / (alpha - 1.0)
+            elif name == 'kolm':
+                alpha = params[0]
+                mu = ts[..., 0] / n
+                h = np.exp(np.multiply(- n * mu[..., None] * alpha, weights)).sum(axis=-1)
+                index = mu + (np.log(h) - np.log(n)) / alpha
+            elif name == 'mad':
+                index = np.abs(rows - ts / n).mean(axis=-1)
+            else:
+                raise ValueError('Unknown index {}'.format(name))
+            profile.append(index)
+    return np.stack(profile, axis=-1)
+
+
+
+# Subgroup decompositions. groups holds the group of every element of the
+# vectors (same shape), or one such grouping per entry of a leading axis.
+# Every grouping must partition the elements; for ego networks, which
+# overlap, decompose the link-level vector (wealth of every link's target)
+# grouped by ego. Results hold one value per vector (and grouping).
+
+def gei_decomposition(vector, groups, alpha=1):
+    """ Decompose the Generalized Entropy Index into within- and between-group parts
+    :param vector: Positive vector, or array of vectors (rows x elements)
+    :param groups: Group of every element, or one grouping per leading entry
+    :param alpha: Index parameter
+    :return: Dict total, within, between (Float or Array); total = within + between
+    """
+    x, codes, units = _get_group_codes(vector, groups)
+    rows, n = x.shape
+    unit_rows = np.arange(codes.shape[0] * rows) % rows
+    values = np.broadcast_to(x, codes.shape).ravel()
+    codes = codes.ravel()
+    n_g = np.bincount(codes)
+    mu_g = np.bincount(codes, values) / n_g
+    mu = x.sum(axis=-1) / n
+    p_g = n_g / n
+    ratio = mu_g / mu[unit_rows][units]
+    s_g = p_g * ratio
+
+    # Values relative to the mean of their vector and of their group
+    r = x / mu[:, None]
+    r_g = values / mu_g[codes]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        if alpha == 0:
+            total = - np.log(r).mean(axis=-1)
+            within_g = - p_g * np.bincount(codes, np.log(r_g)) / n_g
+            between_g = - p_g * np.log(ratio)
+        elif alpha == 1:
+            total = _xlogx(r).mean(axis=-1)
+            within_g = s_g * np.bincount(codes, _xlogx(r_g)) / n_g
+            between_g = s_g * np.log(ratio)
+        else:
+            total = (np.power(r, alpha).mean(axis=-1) - 1) / alpha / (alpha - 1.0)
+            ge_g = (np.bincount(codes, np.power(r_g, alpha)) / n_g - 1) / alpha / (alpha - 1.0)
+            within_g = np.power(p_g, 1.0 - alpha) * np.power(s_g, alpha) * ge_g
+            between_g = p_g * (np.power(ratio, alpha) - 1) / alpha / (alpha - 1.0)
+    return _get_decomposition(vector, groups, total=total[unit_rows],
+                              within=np.bincount(units, within_g),
+                              between=np.bincount(units, between_g))
+
+
+def theil_decomposition(vector, groups):
+    """ Decompose the Theil Index into within- and between-group parts (see gei_decomposition) """
+    return gei_decomposition(vector, groups, 1)
+
+
+def gini_decomposition(vector, groups):
+    """ Decompose the Gini index into within-group, between-group and overlap parts
+    :param vector: Positive vector, or array of vectors (rows x elements)
+    :param groups: Group of every element, or one grouping per leading entry
+    :return: Dict total, within, between, overlap (Float or Array)
+    within is the sum of group Ginis weighted by population times income share,
+    between the Gini with every element at its group mean, overlap the rest
+    (from members of different groups whose incomes overlap).
+    """
+    x, codes, units = _get_group_codes(vector, groups)
+    rows, n = x.shape
+    unit_rows = np.arange(codes.shape[0] * rows) % rows
+    order = np.argsort(x, axis=-1)
+    x_sorted = np.take_along_axis(x, order, axis=-1)
+    y = x_sorted.sum(axis=-1)[unit_rows]
+
+    # One sort of the values, then a stable sort of their group codes
+    codes = np.take_along_axis(codes, np.broadcast_to(order, codes.shape), axis=-1).ravel()
+    values = np.broadcast_to(x_sorted, (unit_rows.size // rows, rows, n)).ravel()
+    perm = np.argsort(codes, kind='stable')
+    codes, values = codes[perm], values[perm]
+    n_g = np.bincount(codes)
+    y_g = np.bincount(codes, values)
+    rank = np.arange(codes.size) - (np.cumsum(n_g) - n_g)[codes] + 1
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        i = np.arange(1, n + 1)
+        total = ((2 * i - n - 1) * x_sorted).sum(axis=-1)[unit_rows] / (n * y)
+        gini_g = np.bincount(codes, (2 * rank - n_g[codes] - 1) * values) / (n_g * y_g)
+        gini_g = np.where(y_g == 0, 0, gini_g)
+        within = np.bincount(units, n_g / n * y_g / y[units] * gini_g)
+
+        # Group means in ascending order within every vector and grouping
+        mu_g = y_g / n_g
+        by_mean = np.lexsort((mu_g, units))
+        n_sorted = n_g[by_mean]
+        before = np.cumsum(n_sorted) - n_sorted - units[by_mean] * n
+        between = np.bincount(units[by_mean], mu_g[by_mean] * n_sorted
+                              * (2 * before + n_sorted - n)) / (n * y)
+    return _get_decomposition(vector, groups, total=total, within=within, between=between,
+                              overlap=total - within - between)
+
+
+def _get_group_codes(vector, groups):
+    """Vectors as 2-D array (rows x elements), group codes (groupings x rows
+    x elements) numbered by vector and grouping (unit), and the unit of
+    every group.
+    """
+    x = np.asarray(vector, dtype=float)
+    groups = np.asarray(groups)
+    num_groupings = groups.shape[0] if groups.ndim > x.ndim else 1
+    groups = np.broadcast_to(groups, (num_groupings,) + x.shape)
+    x = x.reshape(-1, x.shape[-1])
+    groups = groups.reshape((num_groupings,) + x.shape)
+
+    labels = np.unique(groups, return_inverse=True)[1].reshape(groups.shape)
+    num_labels = labels.max() + 1 if labels.size else 1
+    unit = np.arange(num_groupings * x.shape[0]).reshape(num_groupings, x.shape[0], 1)
+    keys, codes = np.unique(unit * num_labels + labels, return_inverse=True)
+    return x, codes.reshape(groups.shape), keys // num_labels
+
+
+def _get_decomposition(vector, groups, **parts):
+    """Parts (one value per grouping and vector) shaped as the input."""
+    shape = np.shape(vector)[:-1]
+    single = np.ndim(groups) <= np.ndim(vector)
+    result = {}
+    for name, values in parts.items():
+        values = values.reshape((-1,) + shape)
+        values = values[0] if single else values
+        result[name] = values if np.ndim(values) else float(values)
+    return result
+
+
+def _xlogx(x):
+    return np.where(x > 0, x * np.log(np.where(x > 0, x, 1)), 0)
+
+
+# Weighted indices: obs_weights gives the number (or weight) of observations
+# of every value, e.g. agents per wealth bin. With whole-number weights the
+# results are those of the vector with every value repeated that often; as
+# there, the log-based indices (GEI 0 and 1, Atkinson 1) leave zeros out.
+
+def _get_obs_weights(vector, obs_weights):
+    vector = np.asarray(vector, dtype=float)
+    obs_weights = np.broadcast_to(np.asarray(obs_weights, dtype=float), vector.shape)
+    if (obs_weights < 0).any():
+        raise TypeError('Observation weights must be positive')
+    if (vector * obs_weights).sum() <= 0:
+        raise TypeError('Vector must be positive')
+    return vector, obs_weights
+
+
+def _keep_observed(vector, obs_weights, drop_zeros):
+    """Values with non-zero observation weights, and non-zero themselves
+    if drop_zeros (log-based indices, as in gei and atkinson).
+    """
+    keep = obs_weights != 0
+    if drop_zeros:
+        keep &= vector != 0
+    return vector[keep], obs_weights[keep]
+
+
+def weighted_gini(vector, obs_weights):
+    """ Calculate the Gini index with observation weights
+    :param vector: Positive vector
+    :param obs_weights: Positive vector of observation weights
+    :return: Gini (Float)
+    """
+    vector, obs_weights = _get_obs_weights(vector, obs_weights)
+    order = np.argsort(vector)
+    x, f = vector[order], obs_weights[order]
+    n = f.sum()
+    before = np.cumsum(f) - f
+    return (x * f * (2 * before + f - n)).sum() / (n * (x * f).sum())
+
+
+def weighted_gei(vector, obs_weights, alpha):
+    """ Calculate the Generalized Entropy Index with observation weights
+    :param vector: Positive vector
+    :param obs_weights: Positive vector of observation weights
+    :param alpha: Index parameter
+    :return: Generalized Entropy Index (Float)
+    """
+    vector, obs_weights = _keep_observed(vector, obs_weights, alpha in [0, 1])
+    p = obs_weights / obs_weights.sum()
+    r = vector / (p * vector).sum()
+    if alpha == 0:
+        return - (p * np.log(r)).sum()
+    elif alpha == 1:
+        return (p * _xlogx(r)).sum()
+    else:
+        return ((p * np.power(r, alpha)).sum() - 1) / alpha / (alpha - 1.0)
+
+
+def weighted_theil(vector, obs_weights):
+    """ Calculate the Theil Index with observation weights (see weighted_gei) """
+    return weighted_gei(vector, obs_weights, 1)
+
+
+def weighted_atkinson(vector, obs_weights, epsilon):
+    """ Calculate the Atkinson inequality index with observation weights
+    :param vector: Positive vector
+    :param obs_weights: Positive vector of observation weights
+    :param epsilon: Index parameter
+    :return: Atkinson inequality (Float)
+    """
+    vector, obs_weights = _get_obs_weights(vector, obs_weights)
+    if epsilon < 0:
+        raise TypeError('Epsilon must be strictly positive')
+    vector, obs_weights = _keep_observed(vector, obs_weights, epsilon == 1)
+    p = obs_weights / obs_weights.sum()
+    mu = (p * vector).sum()
+    if epsilon == 1:
+        return 1 - np.exp((p * np.log(vector)).sum()) / mu
+    else:
+        ede = np.power((p * np.power(vector, 1.0 - epsilon)).sum(), 1.0/(1.0 - epsilon))
+        return 1 - ede / mu
+
+
+def concentration_curve(vector, rank_by, points=101, obs_weights=None):
+    """ Calculate the concentration curve: cumulative share of vector
+    held by the population ranked by rank_by, at points evenly spaced
+    population shares (or the given array of shares), linear in between
+    :param vector: Positive vector
+    :param rank_by: Vector ranking the population
+    :param points: Number of points, or array of population shares
+    :param obs_weights: Positive vector of observation weights
+    :return: Population shares and cumulative shares of vector (Arrays)
+    """
+    vector = np.asarray(vector, dtype=float)
+    obs_weights = np.ones(vector.size) if obs_weights is None else obs_weights
+    vector, obs_weights = _get_obs_weights(vector, obs_weights)
+    order = np.argsort(rank_by, kind='stable')
+    return _get_curve(vector[order], obs_weights[order], points)
+
+
+def lorenz(vector, points=101, obs_weights=None):
+    """ Calculate the Lorenz curve (see concentration_curve)
+    :param vector: Positive vector
+    :param points: Number of points, or array of population shares
+    :param obs_weights: Positive vector of observation weights
+    :return: Population shares and Lorenz curve (Arrays)
+    """
+    if obs_weights is not None:
+        return concentration_curve(vector, vector, points, obs_weights)
+    vector, obs_weights = _get_obs_weights(vector, 1)
+    return _get_curve(np.sort(vector.ravel()), np.broadcast_to(1., vector.size), points)
+
+
+def _get_curve(values, obs_weights, points):
+    """Curve of values (in ranking order) at the population shares."""
+    cum_weights = np.concatenate([[0], np.cumsum(obs_weights)])
+    cum_values = np.concatenate([[0], np.cumsum(values * obs_weights)])
+    shares = np.linspace(0, 1, points) if np.ndim(points) == 0 else np.asarray(points, dtype=float)
+    # np.interp locates the shares by binary search
+    curve = np.interp(shares * cum_weights[-1], cum_weights, cum_values) / cum_values[-1]
+    return shares, curve
@@ -0,0 +1,135 @@
+"""
+Created on Oct 17 2026
+@author: LSE Social Research Lab
+Purpose: Approximate Gini and Lorenz curve for data that does not fit in memory
+GiniSketch takes wealths chunk by chunk and keeps counts per logarithmic
+bucket (as DDSketch): bucket k holds the values in (g^(k-1), g^k], with
+g = (1 + accuracy) / (1 - accuracy), all represented by 2 g^k / (g + 1),
+which is within accuracy (relative) of each of them. Sketches of different
+chunks or worker processes are merged by adding their counts.
+Error bounds, from the relative error of the represented values:
+    |gini - exact gini| <= accuracy (the total wealth is kept exactly)
+    |lorenz(p) - exact lorenz(p)| <= 2 accuracy / (1 - accuracy)
+Up to exact_size values are kept as they are and give the exact results of
+concentration_library.
+
+    sketch = GiniSketch()
+    for chunk in chunks:
+        sketch.update(chunk)
+    sketch.merge(other_sketch)
+    sketch.gini()
+"""
+
+import numpy as np
+from concentration_library import gini, gini_popadj
+
+# Relative accuracy of the represented values
+ACCURACY = 0.001
+
+# Number of values up to which they are kept for exact results
+EXACT_SIZE = 100000
+
+
+class GiniSketch:
+    """Mergeable sketch of a non-negative wealth vector."""
+
+    def __init__(self, accuracy=ACCURACY, exact_size=EXACT_SIZE):
+        if not 0 < accuracy < 1:
+            raise ValueError('accuracy must be between 0 and 1')
+        self.accuracy = accuracy
+        self.exact_size = exact_size
+        self.log_gamma = np.log((1 + accuracy) / (1 - accuracy))
+        self.count = 0
+        self.total = 0.
+        self.zeros = 0
+        self.keys = np.empty(0, dtype=np.int64)
+        self.counts = np.empty(0, dtype=np.int64)
+        self._values = []   # values while exact, None after
+
+    @property
+    def exact(self):
+        return self._values is not None
+
+    def update(self, values):
+        """Add the values of a chunk (array of any shape)."""
+        values = np.asarray(values, dtype=float).ravel()
+        if (values < 0).any():
+            raise ValueError('Wealths must be non-negative')
+        self.count += values.size
+        self.total += values.sum()
+        if self.exact:
+            self._values.append(values)
+            if self.count <= self.exact_size:
+                return
+            values = np.concatenate(self._values)
+            self._values = None
+        self._add_buckets(values)
+
+    def merge(self, other):
+        """Add the values of another sketch with the same accuracy."""
+        if other.accuracy != self.accuracy:
+            raise ValueError('Sketches must have the same accuracy')
+        self.count += other.count
+        self.total += other.total
+        if self.exact and other.exact and self.count <= self.exact_size:
+            self._values.extend(other._values)
+            return self
+        if self.exact:
+            self._add_buckets(np.concatenate(self._values or [np.empty(0)]))
+            self._values = None
+        if other.exact:
+            self._add_buckets(np.concatenate(other._values or [np.empty(0)]))
+        else:
+            self.zeros += other.zeros
+            self._add_counts(other.keys, other.counts)
+        return self
+
+    def gini(self, popadj=False):
+        """Gini (population-size adjusted if popadj) of all values so far."""
+        self._check_count()
+        if self.exact:
+            values = np.concatenate(self._values)
+            return gini_popadj(values) if popadj else gini(values)
+        values, counts = self.get_buckets()
+        before = np.cumsum(counts) - counts
+        n = self.count
+        index = (values * counts * (2 * before + counts - n)).sum() / (n * self.total)
+        return index * n / (n - 1) if popadj else index
+
+    def lorenz(self, points=101):
+        """Lorenz curve (share of the total held by the poorest) at points
+        population shares, evenly spaced from 0 to 1, or at the given array
+        of shares. Linear between the represented values.
+        """
+        self._check_count()
+        shares = np.linspace(0, 1, points) if np.ndim(points) == 0 else np.asarray(points)
+        if self.exact:
+            values = np.sort(np.concatenate(self._values))
+            counts = np.ones(values.size)
+        else:
+            values, counts = self.get_buckets()
+        cum_counts = np.concatenate([[0], np.cumsum(counts)])
+        cum_wealth = np.concatenate([[0], np.cumsum(values * counts)])
+        return np.interp(shares * cum_counts[-1], cum_counts, cum_wealth) / cum_wealth[-1]
+
+    def get_buckets(self):
+        """Represented values (ascending, 0 first) and their counts."""
+        gamma = np.exp(self.log_gamma)
+        values = 2 * np.exp(self.keys * self.log_gamma) / (gamma + 1)
+        return np.concatenate([[0.], values]), np.concatenate([[self.zeros], self.counts])
+
+    def _check_count(self):
+        if not self.count:
+            raise ValueError('The sketch holds no values')
+
+    def _add_buckets(self, values):
+        positive = values[values > 0]
+        self.zeros += values.size - positive.size
+        keys = np.ceil(np.log(positive) / self.log_gamma).astype(np.int64)
+        self._add_counts(keys, np.ones(keys.size, dtype=np.int64))
+
+    def _add_counts(self, keys, counts):
+        keys, inverse = np.unique(np.concatenate([self.keys, keys]), return_inverse=True)
+        self.counts = np.bincount(inverse, np.concatenate([self.counts, counts]),
+                                  minlength=keys.size).astype(np.int64)
+        self.keys = keys
@@ -0,0 +1,347 @@
+"""
+Created on Oct 17 2026
+@author: LSE Social Research Lab
+Purpose: Observation network of the redistribution model
+network-setup links every turtle to num-observed others drawn with
+rnd:weighted-n-of, i.e. weighted sampling without replacement. The weights
+are a salience term of the observed turtle (wealth-visibility) times a
+similarity term of the pair (wealth-assortativity). Here all turtles draw
+at once: candidates are proposed from the salience weights, accepted with
+probability similarity / its upper bound, and duplicates are discarded.
+Keeping the first num-observed distinct accepted draws is successive
+sampling, the same scheme as rnd:weighted-n-of, in O(agents * num-observed)
+expected draws.
+ObsNetwork stores the links in compressed sparse row form, by observer and by
+observed turtle, so reporters over link sets are segment reductions and
+turtles may observe different numbers of others. get_ego_stats computes the
+ego network reporters from a wealth vector and an (agents x num-observed)
+neighbor array, e.g. for networks stored from earlier runs.
+"""
+
+import numpy as np
+import concentration_library as cl
+
+# Rounds of proposals before giving up on turtles without enough candidates
+MAX_ROUNDS = 1000
+
+
+class ObsNetwork:
+    """Directed observation network in CSR form. The turtles observed by
+    turtle i (its out-link-neighbors) are targets[out_ptr[i]:out_ptr[i + 1]],
+    its observers (in-link-neighbors) sources[in_ptr[i]:in_ptr[i + 1]].
+    Indices are int32, so links take 8 bytes plus 8 per turtle for each
+    pointer array. Stacked replicates are numbered replicate * agents + who
+    and form one network without links between replicates.
+    """
+
+    def __init__(self, out_ptr, targets):
+        self.out_ptr = np.asarray(out_ptr, dtype=np.int64)
+        self.targets = np.asarray(targets, dtype=np.int32)
+        n = self.num_agents
+        self.sources = self.get_sources()[np.argsort(self.targets)]
+        self.in_ptr = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(np.bincount(self.targets, minlength=n), out=self.in_ptr[1:])
+
+    @classmethod
+    def from_neighbors(cls, neighbors):
+        """Network from an (..., agents x k) array of out-neighbors as
+        draw_neighbors returns it, -1 marking unused slots. Leading axes are
+        replicates.
+        """
+        neighbors = np.asarray(neighbors)
+        n, k = neighbors.shape[-2:]
+        flat = neighbors.reshape(-1, n, k).astype(np.int64)
+        offsets = (np.arange(flat.shape[0]) * n)[:, None, None]
+        flat = np.where(flat >= 0, flat + offsets, -1).reshape(-1, k)
+        valid = flat >= 0
+        out_ptr = np.zeros(flat.shape[0] + 1, dtype=np.int64)
+        np.cumsum(valid.sum(axis=1), out=out_ptr[1:])
+        return cls(out_ptr, flat[valid])
+
+    @classmethod
+    def from_edges(cls, sources, targets, num_agents):
+        """Network from link ends (observer, observed turtle)."""
+        sources = np.asarray(sources)
+        order = np.argsort(sources, kind='stable')  # keep the order of links
+        out_ptr = np.zeros(num_agents + 1, dtype=np.int64)
+        np.cumsum(np.bincount(sources, minlength=num_agents), out=out_ptr[1:])
+        return cls(out_ptr, np.asarray(targets)[order])
+
+    @property
+    def num_agents(self):
+        return self.out_ptr.size - 1
+
+    @property
+    def num_links(self):
+        return self.targets.size
+
+    def out_degree(self):
+        """Number of turtles each turtle observes."""
+        return np.diff(self.out_ptr)
+
+    def in_degree(self):
+        """Number of observers of each turtle (count my-in-links)."""
+        return np.diff(self.in_ptr)
+
+    def is_regular(self):
+        degree = self.out_degree()
+        return degree.size == 0 or (degree == degree[0]).all()
+
+    def get_sources(self):
+        """Observer of every link, in the order of targets."""
+        return np.repeat(np.arange(self.num_agents, dtype=np.int32), self.out_degree())
+
+    def to_dense(self, replicates=1):
+        """(replicates x agents x k) array of out-neighbors in who numbers
+        of their replicate. Needs the same out-degree for all turtles.
+        """
+        if not self.is_regular():
+            raise ValueError('Turtles observe different numbers of others')
+        n = self.num_agents // replicates
+        return (self.targets % n).reshape(replicates, n, -1)
+
+    def segment_sum(self, values):
+        """Sum over the out-links of each turtle of per-link values (in the
+        order of targets). Turtles without links get 0.
+
+        >>> ObsNetwork.from_edges([0, 0, 1, 1, 1], [1, 2, 0, 2, 3], 4).segment_sum(
+        ...     np.array([1., 2, 3, 4, 5]))
+        array([ 3., 12.,  0.,  0.])
+        """
+        res = np.zeros(self.num_agents, dtype=np.result_type(values, float))
+        # reduceat only at the starts of turtles with links
+        linked = self.out_degree() > 0
+        if linked.any():
+            res[linked] = np.add.reduceat(values, self.out_ptr[:-1][linked])
+        return res
+
+    def get_observed(self, wealth):
+        """observed-mean-wealth, observed-gini and observed-subj-ineq of
+        every turtle for flat wealth (agents). NaN for turtles that observe
+        nobody (and Gini of a single observed turtle).
+        """
+        if self.is_regular() and self.num_links:
+            stats = get_ego_stats(wealth, self.targets.reshape(self.num_agents, -1))
+            return stats['observed_mean_wealth'], stats['observed_gini'], stats['observed_subj_ineq']
+        degree = self.out_degree()
+        nb_wealth = wealth[self.targets]
+        nb_sum = self.segment_sum(nb_wealth)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            mean_wealth = nb_sum / degree
+            mean_wealth_egonet = (wealth + nb_sum) / (degree + 1)
+            sum_diffs = self.segment_sum(np.abs(nb_wealth - np.repeat(wealth, degree)))
+            subj_ineq = sum_diffs / (degree * mean_wealth_egonet)
+        return mean_wealth, self.segment_gini(nb_wealth), subj_ineq
+
+    def segment_gini(self, values):
+        """Population-size adjusted Gini of the per-link values of each
+        turtle, as local-gini: with x sorted ascending and n values,
+        2 / (n - 1) * ((n + 1) / 2 - sum((n - j + 1) * x_j) / sum(x)).
+        """
+        degree = self.out_degree()
+        if self.is_regular() and self.num_links:
+            sorted_values = np.sort(values.reshape(self.num_agents, -1), axis=1).ravel()
+        else:
+            # Sort by value, then by observer with the value rank as tie-break
+            order = np.argsort(values)
+            keys = self.get_sources()[order].astype(np.int64) * self.num_links
+            keys += np.arange(self.num_links)
+            keys.sort()
+            sorted_values = values[order][keys % self.num_links]
+        # Rank from the top within each turtle's links: n - j + 1
+        rank = np.repeat(self.out_ptr[1:], degree) - np.arange(self.num_links)
+        total = self.segment_sum(sorted_values)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            reserve = (degree + 1) / 2 - self.segment_sum(rank * sorted_values) / total
+            reserve = np.where(total == 0, 0, reserve)
+            return np.where(degree > 0, 2 * reserve / (degree - 1), np.nan)
+
+
+def get_ego_stats(wealth, neighbors):
+    """Ego network reporters of every turtle: observed_mean_wealth,
+    observed_gini (local-gini of the neighbors' wealths), observed_subj_ineq
+    and num_observers. wealth is (..., agents) and neighbors (..., agents, k)
+    holds the who numbers of the out-neighbors; leading axes are replicates.
+    Rows of neighbor wealths are sorted once and the Gini comes from their
+    prefix sums. Returns dict of (..., agents) arrays.
+    """
+    wealth = np.asarray(wealth)
+    neighbors = np.asarray(neighbors)
+    n, k = neighbors.shape[-2:]
+    idx = neighbors.reshape(neighbors.shape[:-2] + (-1,))
+    nb_wealth = np.take_along_axis(wealth, idx, axis=-1).reshape(neighbors.shape)
+
+    nb_sum = nb_wealth.sum(axis=-1)
+    mean_wealth_egonet = (wealth + nb_sum) / (k + 1)
+    sum_diffs = np.abs(nb_wealth - wealth[..., None]).sum(axis=-1)
+
+    flat = neighbors.reshape(-1, n * k) + (np.arange(idx.size // (n * k)) * n)[:, None]
+    num_observers = np.bincount(flat.ravel(), minlength=flat.shape[0] * n)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return {'observed_mean_wealth': nb_sum / k,
+                'observed_gini': local_gini(nb_wealth),
+                'observed_subj_ineq': sum_diffs / (k * mean_wealth_egonet),
+                'num_observers': num_observers.reshape(wealth.shape)}
+
+
+def get_ego_measure(wealth, neighbors, measure, *args, include_ego=False):
+    """Inequality measure of concentration_library (function or its name,
+    with extra arguments args) over the wealths each turtle observes, and
+    its own if include_ego. wealth is (agents), neighbors (agents x k).
+    """
+    if isinstance(measure, str):
+        measure = getattr(cl, measure)
+    wealth = np.asarray(wealth)
+    groups = wealth[neighbors]
+    if include_ego:
+        groups = np.column_stack([wealth, groups])
+    # Batched variant for all turtles at once where there is one
+    batch = getattr(cl, measure.__name__ + '_batch', None)
+    if batch is not None:
+        return batch(groups, *args)
+    return np.array([measure(i, *args) for i in groups])
+
+
+def local_gini(wealths):
+    """Population-size adjusted Gini over the last axis, as local-gini and
+    update-gini in NetLogo (0 where there is no wealth).
+    """
+    n = wealths.shape[-1]
+    sorted_wealths = np.sort(wealths, axis=-1)
+    total = sorted_wealths.sum(axis=-1, keepdims=True)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        lorenz = np.cumsum(sorted_wealths, axis=-1) / total
+    reserve = (np.arange(1, n + 1) / n - lorenz).sum(axis=-1)
+    reserve = np.where(total[..., 0] == 0, 0, reserve)
+    return (reserve / n) * 2 * (n / (n - 1))
+
+
+def draw_neighbors(wealth, num_observed, wealth_assortativity, wealth_visibility, rng):
+    """Out-neighbors of every turtle as in network-setup. Each turtle is
+    salient-similar, salient, similar or random with probabilities given by
+    abs wealth-visibility and abs wealth-assortativity. num_observed is a
+    number or one number per turtle.
+    Returns (agents x max num_observed) array of neighbor indices (int32),
+    padded with -1 where a turtle observes fewer.
+    """
+    n = wealth.size
+    salient = rng.random(n) < abs(wealth_visibility)
+    similar = rng.random(n) < abs(wealth_assortativity)
+    return draw_weighted_neighbors(wealth, num_observed, salient, similar,
+                                   wealth_assortativity, wealth_visibility, rng)
+
+
+def draw_weighted_neighbors(wealth, num_observed, salient, similar,
+                            wealth_assortativity, wealth_visibility, rng):
+    """num_observed distinct out-neighbors (never the turtle itself) for
+    every turtle, with probabilities proportional to get_salience (where
+    salient) times get_similarity (where similar), drawn without replacement.
+    Raises ValueError if some turtle has fewer candidates with positive weight.
+    """
+    n = wealth.size
+    degree = np.broadcast_to(np.asarray(num_observed, dtype=int), (n,))
+    k = int(degree.max()) if n else 0
+    if k > n - 1:
+        raise ValueError('num-observed must be smaller than population-size')
+
+    cum_salience = np.cumsum(get_salience(wealth, wealth_visibility))
+    bound = get_similarity_bound(wealth, wealth_assortativity)
+
+    neighbors = np.full((n, k), -1, dtype=np.int32)
+    filled = np.zeros(n, dtype=int)
+    for i in range(MAX_ROUNDS):
+        egos = np.flatnonzero(filled < degree)
+        if egos.size == 0:
+            return neighbors
+        # Propose a few more candidates than missing to absorb rejections
+        size = (5 * (degree[egos] - filled[egos]).max()) // 4 + 2
+        candidates = rng.integers(0, n, (egos.size, size))
+        ego_salient = salient[egos]
+        if ego_salient.any():
+            candidates[ego_salient] = draw_proportional(
+                cum_salience, (ego_salient.sum(), size), rng)
+
+        accept = candidates != egos[:, None]
+        ego_similar = similar[egos]
+        if ego_similar.any():
+            g = get_similarity(wealth[egos, None], wealth[candidates], wealth_assortativity,
+                               wealth.max() - wealth.min())
+            with np.errstate(divide='ignore', invalid='ignore'):
+                p_accept = np.where(ego_similar[:, None], g / bound[egos, None], 1)
+            accept &= rng.random(candidates.shape) < p_accept
+        candidates = np.where(accept, candidates, -1)
+
+        rows = np.hstack([neighbors[egos], candidates])
+        rows, counts = first_distinct(rows, k)
+        counts = np.minimum(counts, degree[egos])
+        rows[np.arange(k)[None, :] >= counts[:, None]] = -1
+        neighbors[egos] = rows
+        filled[egos] = counts
+
+    raise ValueError('Some turtles have fewer than num-observed others with positive weight')
+
+
+def draw_proportional(cum_weights, size, rng):
+    """Indices drawn with replacement with probabilities proportional to the
+    weights whose cumulative sums are cum_weights. Sorted uniforms (from
+    exponential spacings) make the binary search cache friendly and a random
+    permutation turns them back into independent draws.
+    """
+    m = int(np.prod(size))
+    spacings = np.cumsum(rng.standard_exponential(m + 1))
+    u = spacings[:-1] / spacings[-1]
+    idx = np.searchsorted(cum_weights, u * cum_weights[-1], side='right')
+    idx = np.minimum(idx, cum_weights.size - 1)
+    return idx[rng.permutation(m)].reshape(size)
+
+
+def get_salience(wealth, wealth_visibility):
+    """Weight of every turtle as observed one (connect-salient). Wealth is
+    normalized to start from 0 and increase to max-delta-wealth.
+    """
+    if wealth_visibility > 0:
+        # The wealthy are more visible
+        return wealth - wealth.min()
+    elif wealth_visibility < 0:
+        # The poor are more visible
+        return wealth.max() - wealth
+    return np.ones(wealth.size)
+
+
+def get_similarity(ego_wealth, wealth, wealth_assortativity, max_delta_wealth):
+    """Weight of pairs by wealth difference (connect-similar): max-delta-wealth
+    minus the difference for homophily, the difference for heterophily.
+    """
+    diff = np.abs(wealth - ego_wealth)
+    if wealth_assortativity > 0:
+        # Homophily - prefer those similar in wealth
+        return max_delta_wealth - diff
+    # Heterophily - prefer those with more different wealth
+    return diff
+
+
+def get_similarity_bound(wealth, wealth_assortativity):
+    """Largest similarity weight of every turtle over all others."""
+    max_delta_wealth = wealth.max() - wealth.min()
+    if wealth_assortativity > 0:
+        return np.full(wealth.size, max_delta_wealth)
+    return np.maximum(wealth - wealth.min(), wealth.max() - wealth)
+
+
+def first_distinct(rows, k):
+    """First k distinct non-negative values of every row, in row order.
+    Returns (rows x k) array padded with -1 and the count found per row.
+    """
+    order = np.argsort(rows, axis=1, kind='stable')
+    sorted_rows = np.take_along_axis(rows, order, axis=1)
+    first = np.ones(rows.shape, dtype=bool)
+    first[:, 1:] = sorted_rows[:, 1:] != sorted_rows[:, :-1]
+    keep = np.empty(rows.shape, dtype=bool)
+    np.put_along_axis(keep, order, first & (sorted_rows >= 0), axis=1)
+
+    # Bring kept values to the front, keeping their order
+    front = np.argsort(~keep, axis=1, kind='stable')[:, :k]
+    counts = np.minimum(keep.sum(axis=1), k)
+    values = np.take_along_axis(rows, front, axis=1)
+    values[np.arange(k)[None, :] >= counts[:, None]] = -1
+    return values, counts
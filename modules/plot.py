@@ -10,6 +10,7 @@ import seaborn as sns
 import matplotlib as mpl
 import matplotlib.pyplot as plt
 from ineq import *
+from concentration_library import lorenz
 import string
 from matplotlib.offsetbox import OffsetImage, AnnotationBbox
 from matplotlib.gridspec import GridSpec
@@ -396,6 +397,23 @@ def plot2_dynamics(data1, y1, title1, ylim1,
     plt.show()
     plt.close()
 
+def plot_lorenz(vectors, labels, points=101, save=None):
+    """Lorenz curves of wealth vectors of any size, each drawn with points
+    interpolated points (see concentration_library.lorenz).
+    """
+    fig, ax = plt.subplots(1, 1, figsize=(3, 3))
+    ax.plot([0, 1], [0, 1], color='lightgrey', linewidth=0.5)
+    for vector, label in zip(vectors, labels):
+        shares, curve = lorenz(vector, points)
+        ax.plot(shares, curve, linewidth=1, label=label)
+    ax.set(xlim=[0, 1], ylim=[0, 1], xlabel='Population share', ylabel='Wealth share')
+    ax.legend()
+    if save != None:
+        plt.savefig(save, format=save[-3:], bbox_inches='tight')
+    plt.show()
+    plt.close()
+
+
 def plot1_votes_by_status(data, save=None):
     fig, ax = plt.subplots(1, 1, figsize=(5, 2.25))
     _vote_status_violin(ax, data=data, ylabel='Vote', legend=True)
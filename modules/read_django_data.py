@@ -8,7 +8,7 @@ import sqlite3
 import numpy as np
 import pandas as pd
 from ineq import *
-from concentration_library import gini_popadj, mad
+from concentration_library import gini_popadj_batch, mad_batch
 from scipy.stats import kurtosis
 from pandas.api.types import CategoricalDtype
 
@@ -210,13 +210,14 @@ def calculate_group_stats(df, group_vars):
     df['tax_benefit'] = df.groupby(group_vars)['tax_paid'].transform(lambda x: round(sum(x) / 4, 0) )
     df['score'] = df['award'] - df['tax_paid'] + df['tax_benefit']
            
-    # Group Gini
-    df['score_gini'] = df.groupby(group_vars)['score'].transform(gini_popadj)
+    # Group Gini, for all groups at once
+    groups = df.groupby(group_vars).ngroup().to_numpy()
+    df['score_gini'] = gini_popadj_batch(df['score'], groups=groups)[groups]
     
     # Vote polarization: variance (spread)
     df['vote_var'] = df.groupby(group_vars)['vote'].transform(np.var)
     # Vote polarization: mean absolute deviation (spread)
-    df['vote_mad'] = df.groupby(group_vars)['vote'].transform(mad)
+    df['vote_mad'] = mad_batch(df['vote'], groups=groups)[groups]
     # Vote polarization: kurtosis  (bimodality, negative means flatter, 
     # approaching -2 is bimodal) (DiMaggio et al. 1996)
     df['vote_kurt'] = df.groupby(group_vars)['vote'].transform(kurtosis)
@@ -4,10 +4,17 @@ Created on Jun 1 2023
 Purpose: Helping functions for plotting
 """
 
+import io
+import os
+import hashlib
 import numpy as np
 import pandas as pd
 from ineq import *
-from concentration_library import gini_popadj, mad
+from concentration_library import (gini_popadj, mad, inequality_profile, PROFILE,
+                                   gini_decomposition, gei_decomposition)
+from sim_cache import get_cached
+from gini_sketch import GiniSketch, ACCURACY
+from sim_store import is_store, read_meta, read_store, iter_store
 from scipy.stats import pearsonr, kurtosis
 from pandas.api.types import CategoricalDtype
 
@@ -17,191 +24,524 @@ RECODE_STATUSES = {'rich': 'R', 'poor': 'P'}
 NET_CATS = CategoricalDtype(categories=['repr', 'segr', 'homo', 'hete', 'rich', 'poor'])
 STAT_CATS = CategoricalDtype(categories=['P', 'R'])
 
+# NetLogo list metrics, stored as bracketed strings by BehaviorSpace.
+# Votes are tax rates, whole numbers unless tax_step is below 1, and are
+# read as float and kept as int where whole (see narrow_votes)
+LIST_COLS = {'num_observers': int, 'observed_mean_wealth': float, 
+             'observed_gini': float, 'observed_subj_ineq': float, 
+             'wealths': float, 'utilities': float, 'votes': float}
 
-def get_sim_data(dirname, prob=None):   
+
+# BehaviorSpace table columns and their names in the analysis dataframes
+SIM_COLS = {'[run number]': 'run', 'population-size': 'pop_size', 
+            'num-observed': 'num_observed', 'gamma': 'gamma', 'a': 'a', 'b': 'b', 
+            'wealth-assortativity': 'h', 'wealth-visibility': 'v', 
+            '[step]': 'period', 'gini': 'gini', 'median-vote': 'median_vote', 
+            'num-observers': 'num_observers', 
+            'observed-mean-wealth': 'observed_mean_wealth', 
+            'observed-gini': 'observed_gini', 'observed-subj-ineq': 'observed_subj_ineq', 
+            'wealths': 'wealths', 'utilities': 'utilities', 'votes': 'votes'}
+SIM_EXP_COLS = {'[run number]': 'run', 'gamma': 'gamma', 'network': 'network_type', 
+                '[step]': 'period', 'gini': 'gini', 'median-vote': 'median_vote', 
+                'num-observers': 'num_observers', 
+                'observed-mean-wealth': 'observed_mean_wealth', 
+                'observed-gini': 'observed_gini', 'observed-subj-ineq': 'observed_subj_ineq', 
+                'statuses': 'statuses', 'wealths': 'wealths', 
+                'utilities': 'utilities', 'votes': 'votes'}
+
+# Bump when the parsed output changes; cached tables are keyed by it
+# together with a hash of the sources of the parsing below
+READER_VERSION = 1
+
+# Modules whose code shapes the parsed tables
+READER_SOURCES = ['read_netlogo_data', 'ineq', 'concentration_library', 'gini_sketch',
+                  'sim_store', 'sim_cache']
+
+# Run-level measures summarized by get_stats_per_period
+PERIOD_MEASURES = ['gini', 'median_vote', 'vote_var', 'vote_mad', 
+                   'vote_kurt', 'assortativity']
+
+# List columns needed to compute the run-level metrics
+METRIC_LIST_COLS = ['wealths', 'observed_mean_wealth', 'votes']
+
+
+def get_sim_data(dirname, prob=None, chunksize=None, cache_dir=None):   
     """Read csv file with simulation data into pandas dataframe.
+    If chunksize is given, the file is streamed (see iter_sim_data) and 
+    only the compact run-level columns are kept.
+    If cache_dir is given, the parsed table is cached there (see sim_cache)
+    and list columns are memory-mapped on later loads.
+    dirname may also be a typed binary store (see sim_store), which is read
+    without string decoding and not cached.
     """
+    if cache_dir and not is_store(dirname):
+        return get_cached(dirname, lambda path: get_sim_data(path, prob, chunksize), 
+                          cache_dir, *_get_cache_tag('sim', chunksize))
+    if chunksize:
+        return pd.concat(iter_sim_data(dirname, chunksize), ignore_index=True)
     
+    if is_store(dirname):
+        return _prepare_sim_data(read_store(dirname, list(SIM_COLS)))
     df = pd.read_csv(dirname, header=6) 
-    
-    df = df[['[run number]', 'population-size', 'num-observed', 
-                 'gamma', 'a', 'b', 'wealth-assortativity', 'wealth-visibility', 
-                 '[step]', 'gini', 'median-vote', 'num-observers', 
-                 'observed-mean-wealth', 'observed-gini', 'observed-subj-ineq', 
-                 'wealths', 'utilities', 'votes']]
-    df.columns = ['run', 'pop_size', 'num_observed', 
-                    'gamma', 'a', 'b', 'h', 'v', 
-                    'period', 'gini', 'median_vote', 'num_observers', 
-                    'observed_mean_wealth', 'observed_gini', 'observed_subj_ineq', 
-                    'wealths', 'utilities', 'votes']
-    
-    # Actual assortativity: Correlation between own and neighbor's average wealth
-    df['assortativity'] = np.vectorize(get_defacto_assortativity)(df['wealths'], df['observed_mean_wealth'])
-    
-    # Population inequality: Population Gini in all periods and last period
-    # Confirms NetLogo estimates, so no need to duplicate
-    #df['gini_new_estimate'] = np.vectorize(get_new_gini_estimate)(df['wealths'])
-    
-    # Vote polarization: variance (spread), kurtosis 
-    #        (bimodality, negative means flatter, approaching -2 is bimodal) (DiMaggio et al. 1996)
-    df['vote_var'] = np.vectorize(get_vote_variance)(df['votes'])
-    df['vote_mad'] = np.vectorize(get_vote_mad)(df['votes'])
-    df['vote_kurt'] = np.vectorize(get_vote_kurtosis)(df['votes'])
-    
-    return df
+    return _prepare_sim_data(df)
 
 
-def get_sim_data_exp(dirname):   
+def get_sim_data_exp(dirname, chunksize=None, cache_dir=None):   
     """Read csv file with simulation data into pandas dataframe.
+    If chunksize is given, the file is streamed (see iter_sim_data_exp) and 
+    only the compact run-level columns are kept.
+    If cache_dir is given, the parsed table is cached there (see sim_cache)
+    and list columns are memory-mapped on later loads.
+    dirname may also be a typed binary store (see sim_store), which is read
+    without string decoding and not cached.
     """
+    if cache_dir and not is_store(dirname):
+        return get_cached(dirname, lambda path: get_sim_data_exp(path, chunksize), 
+                          cache_dir, *_get_cache_tag('sim_exp', chunksize))
+    if chunksize:
+        return pd.concat(iter_sim_data_exp(dirname, chunksize), ignore_index=True)
     
+    if is_store(dirname):
+        return _prepare_sim_data_exp(read_store(dirname, list(SIM_EXP_COLS)))
     df = pd.read_csv(dirname, header=6) 
+    return _prepare_sim_data_exp(df)
+
+
+def iter_sim_data(dirname, chunksize=1000, keep_lists=False):
+    """Stream csv file with simulation data in chunks of chunksize rows.
+    Yields one dataframe per chunk with the metrics of get_sim_data. 
+    Unless keep_lists, list columns are neither kept nor read beyond those
+    needed for the metrics, so memory stays bounded by the chunk size.
+    """
+    return _iter_table(dirname, SIM_COLS, _prepare_sim_data, chunksize, keep_lists)
+
+
+def iter_sim_data_exp(dirname, chunksize=1000, keep_lists=False):
+    """Stream csv file with simulation data in chunks of chunksize rows.
+    Yields one dataframe per chunk with the metrics of get_sim_data_exp. 
+    Unless keep_lists, list columns are neither kept nor read beyond those
+    needed for the metrics, so memory stays bounded by the chunk size.
+    """
+    return _iter_table(dirname, SIM_EXP_COLS, _prepare_sim_data_exp, chunksize, keep_lists)
+
 
+def _get_cache_tag(name, chunksize):
+    """Cache name (reader and mode) and version (READER_VERSION and a hash 
+    of the READER_SOURCES files) for sim_cache.get_cached.
+    """
+    digest = hashlib.sha256()
+    for i in READER_SOURCES:
+        with open(os.path.join(os.path.dirname(__file__), i + '.py'), 'rb') as f:
+            digest.update(f.read())
+    source = digest.hexdigest()[:12]
+    mode = 'compact' if chunksize else 'full'
+    return '{}-{}'.format(name, mode), 'v{}-{}'.format(READER_VERSION, source)
+
+
+def _iter_table(dirname, columns, prepare, chunksize, keep_lists):
+    if not keep_lists:
+        columns = {i: j for i, j in columns.items() 
+                   if j in METRIC_LIST_COLS or not is_list_col(j)}
+    # 'network' is needed to filter the experiment table even if renamed
+    usecols = set(columns) | {'network'}
+    
+    if is_store(dirname):
+        # Row groups instead of chunks of rows
+        names = [i for i in read_meta(dirname)['columns'] if i in usecols]
+        reader = iter_store(dirname, names)
+    else:
+        reader = pd.read_csv(dirname, header=6, chunksize=chunksize, 
+                             usecols=lambda col: col in usecols)
+    for chunk in reader:
+        chunk = prepare(chunk, columns)
+        if not keep_lists:
+            chunk = chunk.drop(columns=METRIC_LIST_COLS)
+        yield chunk
+
+
+def is_list_col(col):
+    return col in LIST_COLS or col == 'statuses'
+
+
+def _prepare_sim_data(df, columns=SIM_COLS):
+    df = df[list(columns)]
+    df.columns = list(columns.values())
+    return _add_metrics(df)
+
+
+def _prepare_sim_data_exp(df, columns=SIM_EXP_COLS):
     df = df[(df['network'] != 'equal')] # Remove 4-4 for analyses    
-    df = df[['[run number]', 'gamma', 'network',
-             '[step]', 'gini', 'median-vote', 'num-observers', 
-             'observed-mean-wealth', 'observed-gini', 'observed-subj-ineq', 
-             'statuses', 'wealths', 'utilities', 'votes']]
-    df.columns = ['run', 'gamma', 'network_type', 
-                  'period', 'gini', 'median_vote', 'num_observers', 
-                  'observed_mean_wealth', 'observed_gini', 'observed_subj_ineq', 
-                  'statuses', 'wealths', 'utilities', 'votes']
+    df = df[list(columns)]
+    df.columns = list(columns.values())
     
     df['network_type'] = df['network_type'].replace(RECODE_NETS)
     df['network_type'] = df['network_type'].astype(NET_CATS)
+    return _add_metrics(df)
+
+
+def _add_metrics(df):
+    # Decode list strings once; columns hold one array per row from here on
+    df = decode_list_cols(df)
     
     # Actual assortativity: Correlation between own and neighbor's average wealth
-    df['assortativity'] = np.vectorize(get_defacto_assortativity)(df['wealths'], df['observed_mean_wealth'])
-    
     # Vote polarization: variance (spread), kurtosis 
     #        (bimodality, negative means flatter, approaching -2 is bimodal) (DiMaggio et al. 1996)
-    df['vote_var'] = np.vectorize(get_vote_variance)(df['votes'])
-    df['vote_mad'] = np.vectorize(get_vote_mad)(df['votes'])
-    df['vote_kurt'] = np.vectorize(get_vote_kurtosis)(df['votes'])
+    metrics = get_run_metrics(get_matrix(df, 'wealths'), 
+                              get_matrix(df, 'observed_mean_wealth'), 
+                              get_matrix(df, 'votes'))
+    for col, values in metrics.items():
+        df[col] = values
+    
+    # Population inequality: Population Gini in all periods and last period
+    # Confirms NetLogo estimates, so no need to duplicate
+    #df['gini_new_estimate'] = [get_new_gini_estimate(w) for w in df['wealths']]
     
     return df
 
 
 def get_agent_data(df):
+    """Long table with one row per agent, built column-wise from the 
+    decoded per-agent arrays. Runs are re-numbered within each (h, v).
+    """
+    n = _get_num_agents(df)
+    num_obs = get_matrix(df, 'num_observers')
     
-    agent_data = []
+    data = {'run': np.repeat(renumber_runs(df, ['h', 'v']), n),
+            'h': _repeat_as_category(df['h'], n), 
+            'v': _repeat_as_category(df['v'], n),
+            'num_observers': num_obs.ravel(),
+            'log_num_observers': np.log10(num_obs + 1).ravel(),
+            'observed_mean_wealth': get_matrix(df, 'observed_mean_wealth').ravel(),
+            'observed_gini': get_matrix(df, 'observed_gini').ravel(),
+            'observed_subj_ineq': get_matrix(df, 'observed_subj_ineq').ravel(),
+            'wealth': get_matrix(df, 'wealths').ravel(), 
+            'utility': get_matrix(df, 'utilities').ravel(),
+            'vote': get_matrix(df, 'votes').ravel()
+            }
+    return pd.DataFrame(data=data)
+
+
+def get_agent_data_exp(df):
+    """Long table with one row per agent, built column-wise from the 
+    decoded per-agent arrays. Runs are re-numbered within each network_type.
+    """
+    n = _get_num_agents(df)
     
-    for index, row in df.iterrows():
+    data = {'run': np.repeat(renumber_runs(df, ['network_type']), n),
+            'network_type': _repeat_as_category(df['network_type'], n, NET_CATS),
+            'num_observers': get_matrix(df, 'num_observers').ravel(),
+            'observed_mean_wealth': get_matrix(df, 'observed_mean_wealth').ravel(),
+            'observed_gini': get_matrix(df, 'observed_gini').ravel(),
+            'observed_subj_ineq': get_matrix(df, 'observed_subj_ineq').ravel(),
+            'status': pd.Categorical(get_matrix(df, 'statuses').ravel(), dtype=STAT_CATS),
+            'wealth': get_matrix(df, 'wealths').ravel(), 
+            'utility': get_matrix(df, 'utilities').ravel(),
+            'vote': get_matrix(df, 'votes').ravel()
+            }
+    return pd.DataFrame(data=data)
 
-        num_obs = get_ints_from_str(row['num_observers'])
-        log_num_obs = get_logints1_from_str(row['num_observers'])
-        obs_mean_w = get_floats_from_str(row['observed_mean_wealth'])
-        obs_gini = get_floats_from_str(row['observed_gini'])
-        obs_subj_ineq = get_floats_from_str(row['observed_subj_ineq'])
-        w = get_floats_from_str(row['wealths'])
-        u = get_floats_from_str(row['utilities'])
-        v = get_ints_from_str(row['votes'])
 
-        data = {'run': row['run'],
-                'h': row['h'], 
-                'v': row['v'],
-                'num_observers': num_obs,
-                'log_num_observers': log_num_obs,
-                'observed_mean_wealth': obs_mean_w,
-                'observed_gini': obs_gini,
-                'observed_subj_ineq': obs_subj_ineq,
-                'wealth': w, 
-                'utility': u,
-                'vote': v
-                }
-        agent_data.append(pd.DataFrame(data=data))
+def renumber_runs(df, treatment):
+    """Re-number runs 1, 2, ... within each treatment (dense rank of the 
+    BehaviorSpace run number). Returns one compact integer per row of df.
+    """
+    if len(df) == 0:
+        return np.empty(0, dtype=np.int16)
+    runs = df.groupby(treatment, observed=True)['run'].rank('dense')
+    return pd.to_numeric(runs.astype('int'), downcast='integer').to_numpy()
 
-    df_long = pd.concat(agent_data)
-    
-    # Re-number runs by treatment    
-    df_long['run'] = df_long.groupby(['h', 'v'])['run'].rank('dense').astype('int')
-    
-    return df_long
 
+def _get_num_agents(df):
+    return len(df['wealths'].iloc[0]) if len(df) else 0
 
-def get_agent_data_exp(df):
-    
-    agent_data = []
-    
-    for index, row in df.iterrows():
 
-        num_obs = get_ints_from_str(row['num_observers'])
-        obs_mean_w = get_floats_from_str(row['observed_mean_wealth'])
-        obs_gini = get_floats_from_str(row['observed_gini'])
-        obs_subj_ineq = get_floats_from_str(row['observed_subj_ineq'])
-        s = get_strs_from_str(row['statuses'])
-        w = get_floats_from_str(row['wealths'])
-        u = get_floats_from_str(row['utilities'])
-        v = get_ints_from_str(row['votes'])
+def _repeat_as_category(col, n, dtype=None):
+    """Repeat every value of col n times as a categorical.
+    Categories are the sorted observed values unless dtype is given.
+    """
+    cat = pd.Categorical(col, dtype=dtype)
+    return pd.Categorical.from_codes(np.repeat(cat.codes, n), dtype=cat.dtype)
 
-        data = {'run': row['run'],
-                'network_type': row['network_type'],
-                'num_observers': num_obs,
-                'observed_mean_wealth': obs_mean_w,
-                'observed_gini': obs_gini,
-                'observed_subj_ineq': obs_subj_ineq,
-                'status': s,
-                'wealth': w, 
-                'utility': u,
-                'vote': v
-                }
-        agent_data.append(pd.DataFrame(data=data))
 
-    df_long = pd.concat(agent_data)
+def get_run_metrics(wealths, observed_wealths, votes):
+    """Fused run-level metrics over 2-D arrays (rows x agents), computed 
+    row-wise in one vectorized pass:
+    assortativity - Pearson correlation between own and neighbors' mean wealth,
+    vote_var, vote_mad, vote_kurt - vote variance, mean absolute deviation and
+    kurtosis (Fisher, biased, as scipy.stats.kurtosis).
+    Returns dict of 1-D arrays, NaN where a measure is undefined (constant rows).
+    """
+    w = np.asarray(wealths, dtype=float)
+    obs_w = np.asarray(observed_wealths, dtype=float)
+    v = np.asarray(votes, dtype=float)
     
-    # Re-number runs by treatment    
-    df_long['network_type'] = df_long['network_type'].astype(NET_CATS)
-    df_long['status'] = df_long['status'].astype(STAT_CATS)
-    df_long['run'] = df_long.groupby(['network_type'])['run'].rank('dense').astype('int')
+    with np.errstate(divide='ignore', invalid='ignore'):
+        dw = w - w.mean(axis=1, keepdims=True)
+        dobs = obs_w - obs_w.mean(axis=1, keepdims=True)
+        r = (dw * dobs).sum(axis=1) / np.sqrt(np.square(dw).sum(axis=1) * 
+                                              np.square(dobs).sum(axis=1))
+        r = np.clip(r, -1, 1)
+        
+        v_mean = v.mean(axis=1, keepdims=True)
+        dv = v - v_mean
+        dv2 = np.square(dv)
+        m2 = dv2.mean(axis=1)
+        m4 = np.square(dv2).mean(axis=1)
+        kurt = m4 / np.square(m2) - 3
+        # Same constant-input check as scipy.stats.kurtosis
+        kurt[m2 <= np.square(np.finfo(float).eps * v_mean[:, 0])] = np.nan
     
-    return df_long
+    return {'assortativity': r,
+            'vote_var': m2, 
+            'vote_mad': np.abs(dv).mean(axis=1),
+            'vote_kurt': kurt}
 
 
 def get_defacto_assortativity(wealths, observed_wealths):
     """Actual assortativity: Pearson correlation between own and neighbors' mean wealth
-    Gets string of listed wealths and string of listed neighbors' wealths.
+    Gets array of wealths and array of neighbors' mean wealths.
     Returns an objects Pearson correlation coefficient.
     """
-    w = get_floats_from_str(wealths)
-    obs_mean_w = get_floats_from_str(observed_wealths)
-    return pearsonr(w, obs_mean_w).statistic
+    return pearsonr(wealths, observed_wealths).statistic
 
 
 def get_vote_variance(votes):
     """Vote polarization: variance (measures spread)
     See (DiMaggio et al. 1996)
-    Gets string of listed votes.
+    Gets array of votes.
     Returns variance.
     """
-    v = get_ints_from_str(votes)
-    return np.var(v)
+    return np.var(votes)
 
 def get_vote_mad(votes):
     """Vote polarization: mean absolute deviation (measures spread)
-    Gets string of listed votes.
+    Gets array of votes.
     Returns mean absolute deviation.
     """
-    v = get_ints_from_str(votes)
-    return mad(v)
+    return mad(votes)
 
 
 def get_vote_kurtosis(votes):
     """Vote polarization: kurtosis (measures bimodality, negative means flatter, approaching -2 is bimodal)
     See (DiMaggio et al. 1996)
-    Gets string of listed votes.
+    Gets array of votes.
     Returns kurtosis.
     """
-    v = get_ints_from_str(votes)
-    return kurtosis(v)
+    return kurtosis(votes)
 
 
 def get_new_gini_estimate(wealths):
-    return gini_popadj(get_floats_from_str(wealths))
+    return gini_popadj(np.asarray(wealths))
+
+
+def get_inequality_profiles(df, indices=PROFILE, col='wealths'):
+    """Inequality indices (see concentration_library.inequality_profile) 
+    of the decoded list column col in every row of df, computed together.
+    Returns dataframe with the index of df and one column per index.
+    """
+    profiles = inequality_profile(get_matrix(df, col), indices)
+    return pd.DataFrame(profiles, index=df.index)
+
+
+def get_pooled_gini(dirname, by=('h', 'v', 'period'), exp=False, chunksize=1000,
+                    col='wealths', accuracy=ACCURACY):
+    """Gini and Lorenz curve of the list column col of all agents pooled 
+    over the rows of every combination of by, from sketches updated chunk 
+    by chunk (see gini_sketch), so the table need not fit in memory.
+    Returns dataframe with the by columns, gini and lorenz (array).
+    """
+    sketches = {}
+    read = iter_sim_data_exp if exp else iter_sim_data
+    for chunk in read(dirname, chunksize, keep_lists=True):
+        for key, rows in chunk.groupby(list(by), observed=True):
+            if key not in sketches:
+                sketches[key] = GiniSketch(accuracy)
+            sketches[key].update(get_matrix(rows, col))
+    df = pd.DataFrame(list(sketches), columns=list(by))
+    df['gini'] = [i.gini() for i in sketches.values()]
+    df['lorenz'] = [i.lorenz() for i in sketches.values()]
+    return df.sort_values(list(by)).reset_index(drop=True)
+
+
+def get_decompositions(df, by='statuses', index='gini', col='wealths', alpha=1):
+    """Within- and between-group parts of the inequality of the decoded 
+    list column col in every row of df, with groups from the list column 
+    by (e.g. rich and poor statuses). index is 'gini' (with overlap) or 
+    'gei' with parameter alpha (see concentration_library).
+    Returns dataframe with the index of df and one column per part.
+    """
+    wealths, groups = get_matrix(df, col), get_matrix(df, by)
+    if index == 'gini':
+        parts = gini_decomposition(wealths, groups)
+    else:
+        parts = gei_decomposition(wealths, groups, alpha)
+    return pd.DataFrame(parts, index=df.index)
+
+def get_stats_per_period(df, measures=PERIOD_MEASURES, 
+                         quantiles=(0.05, 0.25, 0.5, 0.75, 0.95), treatment=None):
+    """Summary statistics across runs for every (treatment, period) cell,
+    in one grouped pass over the run-level dataframe (get_sim_data*).
+    Treatment is ['h', 'v'] or ['network_type'] unless given.
+    Returns long dataframe with one row per treatment, period and measure, 
+    with columns n, mean, std, quantiles (q05, q25, ...) and delta, the mean
+    per-run change from the previous period (NaN in the first period).
+    """
+    if treatment is None:
+        treatment = ['h', 'v'] if 'h' in df.columns else ['network_type']
+    keys = treatment + ['period']
+    measures = [i for i in measures if i in df.columns]
+    grouped = df.groupby(keys, observed=True)[measures]
+    
+    stats = grouped.agg(['count', 'mean', 'std'])
+    stats.columns = stats.columns.set_names(['measure', 'stat'])
+    stats = stats.stack('measure')
+    stats.columns = ['n', 'mean', 'std']
+    
+    qs = grouped.quantile(list(quantiles))
+    qs.index = qs.index.set_names(keys + ['quantile'])
+    qs.columns = qs.columns.set_names('measure')
+    qs = qs.stack('measure').unstack('quantile')
+    qs.columns = ['q{:02d}'.format(int(round(i * 100))) for i in qs.columns]
+    
+    # Per-run change from the previous period, averaged per cell
+    df_sorted = df.sort_values(treatment + ['run', 'period'])
+    diffs = df_sorted.groupby(treatment + ['run'], observed=True)[measures].diff()
+    diffs = pd.concat([df_sorted[keys], diffs], axis=1)
+    delta = diffs.groupby(keys, observed=True)[measures].mean()
+    delta.columns = delta.columns.set_names('measure')
+    delta = delta.stack('measure').rename('delta')
+    
+    stats = stats.join(qs).join(delta)
+    stats['n'] = stats['n'].astype('int')
+    return stats.reset_index()
+
+def decode_list_cols(df):
+    """Decode every NetLogo list column present in df (see LIST_COLS and 
+    'statuses') in one pass per column. Each cell then holds a 1-D array, 
+    a view into the column's 2-D array; use get_matrix to stack it back.
+    Columns holding lists or arrays instead of strings are stacked as they are.
+    """
+    df = df.copy()
+    for col, dtype in LIST_COLS.items():
+        if col in df.columns:
+            if _is_decoded(df[col]):
+                matrix = get_array_from_lists(df[col], dtype)
+            else:
+                matrix = get_array_from_strs(df[col], dtype)
+            df[col] = list(narrow_votes(matrix) if col == 'votes' else matrix)
+    if 'statuses' in df.columns:
+        if _is_decoded(df['statuses']):
+            statuses = get_array_from_lists(df['statuses'], object)
+            df['statuses'] = list(pd.DataFrame(statuses).replace(RECODE_STATUSES)
+                                  .to_numpy(dtype=object))
+        else:
+            df['statuses'] = list(get_status_array_from_strs(df['statuses']))
+    return df
+
+
+def get_sim_data_from_rows(rows, exp=False):
+    """Dataframe as get_sim_data (or get_sim_data_exp if exp) returns it, 
+    from table rows held in memory (dicts of BehaviorSpace columns with 
+    list metrics as arrays, e.g. from redistribution_model.run_batch).
+    """
+    df = pd.DataFrame(rows)
+    if exp:
+        return _prepare_sim_data_exp(df)
+    return _prepare_sim_data(df)
+
+
+def get_array_from_lists(data, dtype=float):
+    """Stack a column of lists or arrays into a 2-D array (rows x agents).
+    Plain numbers are repeated across the row as in get_array_from_strs.
+    """
+    cells = list(data)
+    lengths = [np.size(i) for i in cells if np.ndim(i)]
+    width = max(lengths, default=1)
+    if any(i != width for i in lengths):
+        raise ValueError('Ragged list column: rows hold between {} and {} values'
+                         .format(min(lengths), width))
+    matrix = np.empty((len(cells), width), dtype=dtype)
+    for i, cell in enumerate(cells):
+        matrix[i] = cell
+    return matrix
+
+
+def narrow_votes(votes):
+    """Votes as int if all are whole numbers, else as they are."""
+    if np.array_equal(votes, np.round(votes)):
+        return votes.astype(int)
+    return votes
+
+
+def _is_decoded(data):
+    return len(data) > 0 and not isinstance(data.iloc[0], str)
+
+
+def get_matrix(df, col):
+    """Stack a decoded list column into a 2-D array (rows x agents)."""
+    if len(df) == 0:
+        return np.empty((0, 0))
+    return np.vstack(df[col].to_numpy())
+
+
+def get_array_from_strs(data, dtype=float):
+    """Decode a column of NetLogo list strings such as '[12.3 45.1 ...]' 
+    into one dense 2-D array (rows x agents) with a single parse.
+    Cells holding a plain number instead of a list (e.g. 'votes' is still 0
+    in step 0, before the first vote) are repeated across the row.
+    Raises ValueError if the lists differ in length (ragged column).
+    """
+    cells = pd.Series(data, dtype=object).astype(str).reset_index(drop=True)
+    is_list = cells.str.startswith('[').to_numpy()
+    strs = _strip_brackets(cells[is_list])
+    
+    if not any(strs):
+        # All lists empty, or only plain numbers (one value per row)
+        width = 0 if strs or not len(cells) else 1
+        values = np.empty((len(strs), width), dtype=dtype)
+    else:
+        try:
+            values = np.loadtxt(io.StringIO('\n'.join(strs)), dtype=dtype, 
+                                comments=None, ndmin=2)
+        except ValueError as err:
+            raise ValueError('Ragged or malformed list column: {}'.format(err)) from err
+        if values.shape[0] != len(strs):
+            raise ValueError('Ragged list column: some rows hold empty lists')
+    if is_list.all():
+        return values
+    
+    matrix = np.empty((len(cells), values.shape[1]), dtype=dtype)
+    matrix[is_list] = values
+    matrix[~is_list] = cells[~is_list].astype(float).to_numpy()[:, None]
+    return matrix
+
+
+def get_status_array_from_strs(data):
+    """Decode a column of NetLogo status lists such as '[rich poor ...]' 
+    into a 2-D array of recoded statuses (see RECODE_STATUSES).
+    """
+    strs = _strip_brackets(data)
+    nrows, ncols = _get_list_shape(strs)
+    values = pd.Series(' '.join(strs).split()).map(RECODE_STATUSES)
+    return values.to_numpy(dtype=object).reshape(nrows, ncols)
+
+
+def _strip_brackets(data):
+    return pd.Series(data, dtype=object).str.strip('[]').tolist()
+
+
+def _get_list_shape(strs):
+    """Return (rows, agents) for a list of bracket-stripped list strings.
+    Raises ValueError if the number of values differs between rows.
+    """
+    lengths = np.array([len(i.split()) for i in strs], dtype=int)
+    if lengths.size == 0:
+        return 0, 0
+    if (lengths != lengths[0]).any():
+        raise ValueError('Ragged list column: rows hold between {} and {} values'
+                         .format(lengths.min(), lengths.max()))
+    return lengths.size, lengths[0]
 
-def get_stats_per_period(df):
-    periods = list(sorted(df['period'].unique()))
-    for i in periods:
-        pass
 
 def get_floats_from_str(datum):
     return [float(i) for i in datum.rstrip(']').lstrip('[').split()]
@@ -0,0 +1,659 @@
+"""
+Created on Oct 17 2026
+@author: LSE Social Research Lab
+Purpose: NumPy implementation of redistribution_model.nlogo
+Agents are held as arrays in who order (the order of NetLogo's sort turtles),
+the observation network as an obs_network.ObsNetwork.
+Replicates can be stacked along a leading axis and run together.
+ExperimentBatch implements redistribution_experiment.nlogo on the same engine.
+Procedures keep the names of the NetLogo model. run() reports the same
+metrics as BehaviorSpace and write_table() stores them in its table format,
+so the tables can be read with read_netlogo_data.get_sim_data.
+"""
+
+import csv
+import warnings
+import numpy as np
+import pandas as pd
+from scipy.stats import ks_2samp
+from obs_network import ObsNetwork, draw_neighbors, local_gini
+from sim_store import get_stamp
+
+# Fehr and Schmidt (1999) estimates, see turtle-setup
+ALPHAS = [0, 0, 0, 0.5, 0.5, 0.5, 1, 1, 1, 4]
+BETAS = [0, 0, 0, 0.25, 0.25, 0.25, 0.6, 0.6, 0.6, 0.6]
+
+TAX_RATES = np.arange(101)
+
+# NetLogo interface variables and their names in RedistributionModel
+PARAMS = {'population-size': 'population_size', 'num-observed': 'num_observed',
+          'resize-nodes?': 'resize_nodes', 'probabilistic?': 'probabilistic',
+          'gamma': 'gamma', 'a': 'a', 'b': 'b',
+          'wealth-assortativity': 'wealth_assortativity',
+          'wealth-visibility': 'wealth_visibility'}
+
+DEFAULTS = {'population_size': 200, 'num_observed': 8, 'a': 1, 'b': 6,
+            'wealth_assortativity': 0, 'wealth_visibility': 0,
+            'probabilistic': True, 'gamma': 0, 'resize_nodes': False}
+
+# NetLogo variables of redistribution_experiment.nlogo and their names in
+# ExperimentBatch; population-size and num-observed are fixed in its setup
+EXP_PARAMS = {'gamma': 'gamma', 'inequality': 'inequality', 'network': 'network',
+              'resize-nodes?': 'resize_nodes'}
+
+EXP_DEFAULTS = {'population_size': 24, 'num_observed': 8, 'probabilistic': True,
+                'gamma': 0, 'inequality': 'high', 'network': 'representative',
+                'resize_nodes': False}
+
+# Rich turtles (who numbers 0..n-1) and perturbations of income by inequality
+NUM_RICH = {'high': 9, 'low': 12}
+PERTURB_RICH = {'high': [-0.1, -0.075, -0.05, -0.025, 0.0, 0.025, 0.05, 0.075, 0.1],
+                'low': [-0.1, -0.08, -0.06, -0.04, -0.02, 0.0, 0.0, 0.02, 0.04, 0.06, 0.08, 0.1]}
+PERTURB_POOR = {'high': [-0.1, -0.086, -0.071, -0.057, -0.043, -0.029, -0.014, 0.0,
+                         0.014, 0.029, 0.043, 0.057, 0.071, 0.086, 0.1],
+                'low': PERTURB_RICH['low']}
+
+# Links of every turtle by network: (group, number) drawn with n-of, groups
+# relative to own status ('same', 'different') or absolute ('rich', 'poor')
+EXP_NETWORKS = {'homophily': [('same', 6), ('different', 2)],
+                'heterophily': [('same', 2), ('different', 6)],
+                'rich visible': [('rich', 6), ('poor', 2)],
+                'poor visible': [('rich', 2), ('poor', 6)],
+                'segregated': [('same', 8)],
+                'equal': [('rich', 4), ('poor', 4)],
+                ('representative', 'low'): [('rich', 4), ('poor', 4)],
+                ('representative', 'high'): [('rich', 3), ('poor', 5)]}
+
+# Strength of the weights in the softmax choice (hardness), as set in setup.
+# setup also sets behavior-error to 0.01, but the NetLogo model never
+# applies it, so the behavior_error option is 0 by default
+HARDNESS = 0.1
+
+# Slope relative to intercept below which utilities are equal up to rounding
+FLAT_SLOPE = 1e-8
+
+# Steps between exact recomputes of the ego statistics in incremental mode,
+# and the relative difference from them reported as numerical drift
+RECOMPUTE_EVERY = 10
+DRIFT_TOL = 1e-9
+
+# Metrics of the BehaviorSpace experiments, in order
+METRICS = ['gini', 'median-vote', 'num-observers', 'observed-mean-wealth',
+           'observed-gini', 'observed-subj-ineq', 'wealths', 'utilities', 'votes']
+EXP_METRICS = METRICS[:6] + ['statuses'] + METRICS[6:]
+
+
+class RedistributionBatch:
+    """Replicates of the generic model run together: agent arrays have a
+    leading replicate axis (replicates x agents) and one ObsNetwork holds
+    the links of all replicates. Every replicate has its own random
+    stream from its seed, so it gives the same run as RedistributionModel
+    with that seed. params is a list of dicts of NetLogo variable names,
+    one per replicate; a, b, gamma, wealth-assortativity (h) and
+    wealth-visibility (v) may differ between replicates, population-size,
+    num-observed and probabilistic? must be shared. Votes are on tax rates
+    0-100% in steps of tax_step percent (1 in NetLogo).
+    With incremental, ego statistics are carried across redistribute by
+    the flat tax's affine map instead of being recomputed over all links,
+    and recomputed exactly every recompute_every steps to check for drift.
+    Probabilistic votes are drawn with the given hardness, by default from
+    the closed form for linear utilities, with closed_form=False from the
+    full (agents x tax rates) utility matrix. Deterministic votes are for a
+    random tax rate with probability behavior_error (0, i.e. never, as in
+    NetLogo).
+    """
+    variables = PARAMS
+    defaults = DEFAULTS
+    metrics = METRICS
+
+    def __init__(self, params, seeds, tax_step=1, incremental=False,
+                 recompute_every=RECOMPUTE_EVERY, hardness=HARDNESS, behavior_error=0,
+                 closed_form=True):
+        params = [{self.variables[i]: j for i, j in p.items() if i in self.variables}
+                  for p in params]
+        if len(seeds) != len(params):
+            raise ValueError('Need one seed per replicate')
+        shared = ['population_size', 'num_observed', 'probabilistic']
+        for i in shared:
+            if len({p.get(i, self.defaults[i]) for p in params}) > 1:
+                raise ValueError('{} must be the same for all replicates'.format(i))
+
+        for i, default in self.defaults.items():
+            values = np.array([p.get(i, default) for p in params])
+            setattr(self, i, values[0] if i in shared else values)
+        self.population_size = int(self.population_size)
+        self.num_observed = int(self.num_observed)
+        self.replicates = len(params)
+        self.rngs = [np.random.default_rng(i) for i in seeds]
+        self.tax_step = tax_step
+        self.tax_rates = get_tax_rates(tax_step)
+        self.incremental = incremental
+        self.recompute_every = recompute_every
+        self.max_drift = 0.
+        self.hardness = hardness
+        self.behavior_error = behavior_error
+        self.closed_form = closed_form
+        # Weight of the tax loss in the utility (gamma, experiment model only)
+        self.loss_aversion = np.zeros(self.replicates)
+
+    def setup(self):
+        n = self.population_size
+        self.ticks = 0
+
+        self.alpha = np.empty((self.replicates, n))
+        self.beta = np.empty((self.replicates, n))
+        self.income = np.empty((self.replicates, n))
+        for r, rng in enumerate(self.rngs):
+            self.turtle_setup(r, rng)
+        self.wealth = self.income.copy()
+
+        # Normalizing constants before creating observation network
+        self.max_wealth = self.wealth.max(axis=1)
+        self.min_wealth = self.wealth.min(axis=1)
+        self.max_delta_wealth = self.max_wealth - self.min_wealth
+        self.network_setup()
+
+        self.num_observers = self.network.in_degree().reshape(self.replicates, n)
+        self.wealths = self.wealth.copy()
+        self.update_observed()
+        self.update_gini()
+        # Globals not set before the first vote are 0 in NetLogo
+        self.votes = np.zeros((self.replicates, 1), dtype=int)
+        self.median_vote = np.zeros(self.replicates, dtype=int)
+
+        # Utility at own wealth (no tax)
+        self.utility = self.get_utility_lines()[0]
+        self.utilities = self.utility.copy()
+
+    def turtle_setup(self, r, rng):
+        n = self.population_size
+        self.alpha[r] = rng.choice(ALPHAS, n)
+        self.beta[r] = rng.choice(BETAS, n)
+        a, b = self.a[r], self.b[r]
+        self.income[r] = 100 * rng.beta(a, b, n) / (a / (a + b))
+
+    def network_setup(self):
+        """Each turtle links to num-observed others, drawn by weighted
+        sampling without replacement (rnd:weighted-n-of).
+        """
+        self.network = ObsNetwork.from_neighbors(np.stack([
+            draw_neighbors(self.wealth[r], self.num_observed,
+                           self.wealth_assortativity[r], self.wealth_visibility[r], rng)
+            for r, rng in enumerate(self.rngs)]))
+
+    def go(self):
+        # Update wealths based on vote from previous period
+        if self.ticks > 0:
+            self.redistribute()
+        if not self.incremental:
+            self.update_gini()
+
+        # Vote based on estimates of future post-tax wealths
+        self.vote()
+        self.median_vote = self.tax_rates[netlogo_round(np.median(self.votes, axis=1)
+                                                        / self.tax_step)]
+        self.ticks += 1
+
+    def vote(self):
+        n = self.population_size
+        intercept, slope = self.get_utility_lines()
+        u = None
+        if self.probabilistic:
+            u = np.stack([rng.random(n) for rng in self.rngs])
+            if self.closed_form:
+                choice = luce_choice_linear(slope, u, self.hardness, self.tax_rates)
+            else:
+                choice = luce_choice(get_possible_utilities(intercept, slope, self.tax_rates),
+                                     u[..., None], self.hardness)
+        else:
+            # Linear utilities peak at 0 or 100%
+            choice = np.where(slope > 0, self.tax_rates.size - 1, 0)
+            if self.behavior_error:
+                u = np.stack([rng.random(n) for rng in self.rngs])
+                choice = error_choice(choice, u, self.behavior_error, self.tax_rates.size)
+
+        # Where utilities only differ by rounding error (e.g. all wealths
+        # equal), ties are broken as in the rate by rate scan
+        flat = np.abs(slope) <= FLAT_SLOPE * np.abs(intercept)
+        if flat.any():
+            choice[flat] = self.scan_choice(np.flatnonzero(flat), u)
+        self.votes = self.tax_rates[choice]
+
+    def scan_choice(self, egos, u=None):
+        """Vote index of the given (flat) turtles from their utilities
+        computed rate by rate, with uniform draws u if probabilistic or
+        with behavior error.
+        """
+        network = self.network
+        wealth, alpha, beta = self.wealth.ravel(), self.alpha.ravel(), self.beta.ravel()
+        gamma = np.repeat(self.loss_aversion, self.population_size)
+        degree = network.out_degree()[egos]
+        choice = np.zeros(egos.size, dtype=int)
+        for d in np.unique(degree[degree > 0]):
+            sel = degree == d
+            ego = egos[sel]
+            links = network.out_ptr[ego][:, None] + np.arange(d)
+            possible_utilities = scan_possible_utilities(
+                wealth[ego], wealth[network.targets[links]], alpha[ego], beta[ego],
+                self.tax_rates, gamma[ego])
+            if self.probabilistic:
+                choice[sel] = luce_choice(possible_utilities, u.ravel()[ego][:, None],
+                                          self.hardness)
+            else:
+                best = possible_utilities.argmax(axis=-1)
+                if self.behavior_error:
+                    best = error_choice(best, u.ravel()[ego], self.behavior_error,
+                                        self.tax_rates.size)
+                choice[sel] = position(possible_utilities, best)
+        return choice
+
+    def get_utility_lines(self):
+        """Intercept and slope of every turtle's utility in the tax rate."""
+        if self.incremental:
+            intercept, slope = utility_line(self.wealth, self.observed_mean_wealth, self.ineq)
+        else:
+            lines = get_utility_line(self.wealth.ravel(), self.alpha.ravel(),
+                                     self.beta.ravel(), self.network)
+            intercept, slope = [i.reshape(self.wealth.shape) for i in lines]
+        if self.loss_aversion.any():
+            # Tax loss t / 100 * wealth
+            slope = slope - self.loss_aversion[:, None] * self.wealth
+        return intercept, slope
+
+    def redistribute(self):
+        # Update wealth based on last period's vote
+        mv = self.median_vote[:, None]
+        shift = mv * self.wealths.sum(axis=1, keepdims=True) / (self.population_size * 100)
+        if self.incremental:
+            self.advance_observed(1 - mv / 100, shift)
+        self.wealth = self.wealth - (mv * self.wealth / 100) + shift
+        self.wealths = self.wealth.copy()
+        if not self.incremental:
+            self.update_observed()
+        elif self.ticks % self.recompute_every == 0:
+            self.check_observed()
+
+    def update_observed(self):
+        """observed-mean-wealth, observed-gini and observed-subj-ineq
+        (and the inequity terms of the utility if incremental).
+        """
+        observed = self.network.get_observed(self.wealth.ravel())
+        (self.observed_mean_wealth, self.observed_gini,
+         self.observed_subj_ineq) = [i.reshape(self.wealth.shape) for i in observed]
+        if self.incremental:
+            self.ineq = get_inequity(self.wealth.ravel(), self.alpha.ravel(), self.beta.ravel(),
+                                     self.network)[1].reshape(self.wealth.shape)
+
+    def advance_observed(self, scale, shift):
+        """Move the ego statistics and the Gini along with the wealths,
+        before they change by w' = scale * w + shift (per replicate).
+        Orderings are kept, so means move the same way, differences and the
+        inequity terms scale, and the Ginis scale with the ratio of means.
+        """
+        degree = self.network.out_degree().reshape(self.wealth.shape)
+        mean = self.observed_mean_wealth
+        mean_egonet = (self.wealth + degree * mean) / (degree + 1)
+        new_mean = scale * mean + shift
+        with np.errstate(divide='ignore', invalid='ignore'):
+            self.observed_gini = self.observed_gini * scale * mean / new_mean
+            self.observed_subj_ineq = (self.observed_subj_ineq * scale * mean_egonet
+                                       / (scale * mean_egonet + shift))
+        self.observed_mean_wealth = new_mean
+        self.ineq = self.ineq * scale
+        # The tax keeps the mean wealth
+        self.gini = self.gini * scale[:, 0]
+
+    def check_observed(self):
+        """Replace the incrementally updated statistics by exact ones and
+        keep the largest relative difference in max_drift.
+        """
+        names = ['observed_mean_wealth', 'observed_gini', 'observed_subj_ineq', 'ineq', 'gini']
+        advanced = [getattr(self, i) for i in names]
+        self.update_observed()
+        self.update_gini()
+        for i, values in zip(names, advanced):
+            exact = getattr(self, i)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                drift = np.abs(values - exact) / np.maximum(np.abs(exact), 1)
+            if np.isfinite(drift).any():
+                self.max_drift = max(self.max_drift, np.nanmax(drift))
+        if self.max_drift > DRIFT_TOL:
+            warnings.warn('Incremental ego statistics drifted by {:.2g}'.format(self.max_drift))
+
+    def update_gini(self):
+        self.gini = local_gini(self.wealth)
+
+    def report(self, r):
+        """Current values of the BehaviorSpace metrics of replicate r."""
+        votes = self.votes[r]
+        values = {'gini': self.gini[r], 'median-vote': self.median_vote[r],
+                  'num-observers': self.num_observers[r],
+                  'observed-mean-wealth': self.observed_mean_wealth[r],
+                  'observed-gini': self.observed_gini[r],
+                  'observed-subj-ineq': self.observed_subj_ineq[r],
+                  'wealths': self.wealths[r], 'utilities': self.utilities[r],
+                  'votes': votes[0] if votes.size == 1 else votes}
+        if 'statuses' in self.metrics:
+            values['statuses'] = self.statuses[r]
+        return {i: values[i] for i in self.metrics}
+
+
+class RedistributionModel(RedistributionBatch):
+    """Generic model for a large population with beta-distributed wealth
+    and an observation network shaped by wealth-assortativity (h) and
+    wealth-visibility (v). Parameters are the NetLogo interface variables.
+    gamma and resize_nodes are only recorded (unused in the NetLogo model).
+    A single replicate of RedistributionBatch, options are its keyword
+    arguments (tax_step, incremental, recompute_every, hardness,
+    behavior_error, closed_form).
+    """
+
+    def __init__(self, population_size=200, num_observed=8, a=1, b=6,
+                 wealth_assortativity=0, wealth_visibility=0,
+                 probabilistic=True, gamma=0, resize_nodes=False, seed=None,
+                 **options):
+        params = {'population-size': population_size, 'num-observed': num_observed,
+                  'a': a, 'b': b, 'wealth-assortativity': wealth_assortativity,
+                  'wealth-visibility': wealth_visibility,
+                  'probabilistic?': probabilistic, 'gamma': gamma,
+                  'resize-nodes?': resize_nodes}
+        super().__init__([params], [seed], **options)
+
+    @classmethod
+    def from_netlogo(cls, params, seed=None, **options):
+        """Model from a dict of NetLogo variable names, e.g. 'population-size'."""
+        return cls(**{PARAMS[i]: j for i, j in params.items() if i in PARAMS}, seed=seed,
+                   **options)
+
+    def report(self, r=0):
+        return super().report(r)
+
+
+class ExperimentBatch(RedistributionBatch):
+    """Replicates of redistribution_experiment.nlogo: 24 turtles, rich or
+    poor by who number with perturbed incomes (inequality 'high' or 'low'),
+    8 links each drawn uniformly from status groups set by network, and a
+    loss aversion gamma on the tax paid. params are dicts of its NetLogo
+    variables (gamma, inequality, network, resize-nodes?).
+    """
+    variables = EXP_PARAMS
+    defaults = EXP_DEFAULTS
+    metrics = EXP_METRICS
+
+    def __init__(self, params, seeds, **options):
+        super().__init__(params, seeds, **options)
+        self.loss_aversion = self.gamma.astype(float)
+
+    def setup(self):
+        self.statuses = np.empty((self.replicates, self.population_size), dtype=object)
+        super().setup()
+
+    def turtle_setup(self, r, rng):
+        n = self.population_size
+        inequality = self.inequality[r]
+        num_rich = NUM_RICH[inequality]
+        self.alpha[r] = rng.choice(ALPHAS, n)
+        self.beta[r] = rng.choice(BETAS, n)
+        self.statuses[r] = ['rich'] * num_rich + ['poor'] * (n - num_rich)
+        perturb_rich = rng.permutation(PERTURB_RICH[inequality])
+        perturb_poor = rng.permutation(PERTURB_POOR[inequality])
+        self.income[r] = np.concatenate([(1 + perturb_rich) * 200, (1 + perturb_poor) * 20])
+
+    def network_setup(self):
+        n, k = self.population_size, self.num_observed
+        neighbors = np.empty((self.replicates, n, k), dtype=np.int32)
+        for r, rng in enumerate(self.rngs):
+            rich = self.statuses[r] == 'rich'
+            groups = {'rich': np.broadcast_to(rich, (n, n)),
+                      'poor': np.broadcast_to(~rich, (n, n)),
+                      'same': rich[:, None] == rich[None, :],
+                      'different': rich[:, None] != rich[None, :]}
+            rule = EXP_NETWORKS.get(self.network[r],
+                                    EXP_NETWORKS.get((self.network[r], self.inequality[r])))
+            if rule is None:
+                raise ValueError('Unknown network {}'.format(self.network[r]))
+            start = 0
+            for group, num in rule:
+                # n-of num from the group, never the turtle itself
+                candidates = groups[group] & ~np.eye(n, dtype=bool)
+                if (candidates.sum(axis=1) < num).any():
+                    raise ValueError('Too few turtles for network {}'.format(self.network[r]))
+                keys = np.where(candidates, rng.random((n, n)), np.inf)
+                neighbors[r, :, start:start + num] = np.argsort(keys, axis=1)[:, :num]
+                start += num
+        self.network = ObsNetwork.from_neighbors(neighbors)
+
+
+def get_tax_rates(tax_step=1):
+    """Tax rates 0-100% in steps of tax_step percent. Fractional steps
+    give the floats nearest to the points of the grid (0.3, not
+    0.30000000000000004), so tables print them as short as NetLogo does.
+    """
+    num_steps = round(100 / tax_step)
+    if not np.isclose(num_steps * tax_step, 100):
+        raise ValueError('tax_step must divide 100')
+    if float(tax_step).is_integer():
+        return np.arange(num_steps + 1) * tax_step
+    return np.arange(num_steps + 1) * 100 / num_steps
+
+
+def get_utility_line(wealth, alpha, beta, network):
+    """Utility of every turtle for tax rate t (in %) based on own reference
+    group, as intercept + slope * t / 100. Under a flat tax with the benefit
+    estimated from the observed mean, the differences to the neighbors are
+    the pre-tax ones times (1 - t / 100), so get-possible-utilities is linear
+    in t and the intercept is calculate-utility at own wealth.
+    wealth, alpha and beta are flat (agents), network an ObsNetwork.
+    """
+    return utility_line(wealth, *get_inequity(wealth, alpha, beta, network))
+
+
+def utility_line(wealth, observed_mean, ineq):
+    """Intercept and slope of the utility from the observed mean wealth and
+    the inequity term of get_inequity.
+    """
+    return wealth - ineq, observed_mean - wealth + ineq
+
+
+def get_inequity(wealth, alpha, beta, network):
+    """Observed mean wealth and the inequity term of calculate-utility at
+    own wealth (disadvantageous plus advantageous inequality) of every turtle.
+    """
+    degree = network.out_degree()
+    nb_wealth = wealth[network.targets]
+    diff = nb_wealth - np.repeat(wealth, degree)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        observed_mean = network.segment_sum(nb_wealth) / degree
+        ineq = (alpha * network.segment_sum(np.maximum(0, diff))
+                + beta * network.segment_sum(np.maximum(0, -diff))) / degree
+    return observed_mean, ineq
+
+
+def get_possible_utilities(intercept, slope, tax_rates=TAX_RATES):
+    """Utility curves (..., agents, tax rates) from get_utility_line."""
+    return intercept[..., None] + slope[..., None] * (tax_rates / 100)
+
+
+def luce_choice_linear(slope, u, hardness, tax_rates=TAX_RATES):
+    """Index of the tax rate drawn by luce_choice for linear utilities with
+    the given slopes and uniform draws u (same shape). The weights are then
+    geometric, so the inverse CDF has a closed form: with c = hardness *
+    slope * step / 100 and G rates, the choice is ceil(x) - 1 where
+    (1 - exp(c x)) / (1 - exp(c G)) = u.
+    """
+    num_rates = tax_rates.size
+    c = hardness * slope * (tax_rates[1] - tax_rates[0]) / 100
+    z = c * num_rates
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        # log1p(u * expm1(z)) without overflow for large positive z
+        log_u = np.where(z > 0, z + np.log(u + (1 - u) * np.exp(-np.abs(z))),
+                         np.log1p(u * np.expm1(np.minimum(z, 0))))
+        x = np.where(c == 0, u * num_rates, log_u / c)
+    choice = np.clip(np.ceil(x).astype(int) - 1, 0, num_rates - 1)
+    # Equal utilities for all rates: position reports the first
+    return np.where(slope == 0, 0, choice)
+
+
+def scan_possible_utilities(wealth, nb_wealth, alpha, beta, tax_rates=TAX_RATES, gamma=0):
+    """Utility of every turtle for all tax rates, computed rate by rate as
+    get-possible-utilities does. wealth, alpha, beta and gamma (loss
+    aversion) are (..., agents), nb_wealth (..., agents, k) the wealth of
+    the neighbors. Returns (..., agents, tax rates).
+    """
+    k = nb_wealth.shape[-1]
+    t = tax_rates[:, None] / 100
+    nb_wealth = nb_wealth[..., None, :]
+    own = wealth[..., None, None]
+
+    # Fixed tax rate, tax benefit estimated from local sample
+    tax_benefit = t * nb_wealth.sum(axis=-1, keepdims=True) / k
+    my_wealth = own + tax_benefit - t * own
+    neighbors_wealths = nb_wealth + tax_benefit - t * nb_wealth
+    loss_aversion = np.asarray(gamma)[..., None] * (t[:, 0] * wealth[..., None])
+    return calculate_utility(alpha, beta, my_wealth[..., 0], neighbors_wealths, k,
+                             loss_aversion)
+
+
+def calculate_utility(alpha, beta, my_wealth, neighbors_wealths, num_observed,
+                      loss_aversion=0):
+    """Inequality-averse utility (Fehr and Schmidt 1999). alpha and beta are
+    (..., agents), my_wealth (..., agents, ...) and neighbors_wealths the
+    same with the neighbors on a last axis. loss_aversion (gamma times the
+    tax loss) is subtracted as in the experiment model.
+    """
+    extra = (1,) * (my_wealth.ndim - alpha.ndim)
+    alpha = alpha.reshape(alpha.shape + extra)
+    beta = beta.reshape(beta.shape + extra)
+    diff = neighbors_wealths - my_wealth[..., None]
+    disadvantageous_ineq = alpha * np.maximum(0, diff).sum(axis=-1) / num_observed
+    advantageous_ineq = beta * np.maximum(0, -diff).sum(axis=-1) / num_observed
+    return my_wealth - loss_aversion - disadvantageous_ineq - advantageous_ineq
+
+
+def luce_choice(possible_utilities, u, hardness):
+    """Vote drawn with probabilities exp(hardness * utility) / sumexp
+    (Luce's choice axiom, rnd:weighted-one-of-list) by inverse CDF with
+    uniform draws u of shape (..., agents, 1), for all agents at once.
+    sumexp is taken after subtracting each agent's largest exponent (log-
+    sum-exp), so large utilities or hardness do not overflow.
+    """
+    x = hardness * possible_utilities
+    x = x - x.max(axis=-1, keepdims=True)
+    log_sumexp = np.log(np.exp(x).sum(axis=-1, keepdims=True))
+    cdf = np.cumsum(np.exp(x - log_sumexp), axis=-1)
+    choice = np.minimum((cdf < u).sum(axis=-1), possible_utilities.shape[-1] - 1)
+    return position(possible_utilities, choice)
+
+
+def error_choice(choice, u, behavior_error, num_rates):
+    """Choice replaced by a uniformly drawn tax rate index where the
+    uniform draws u are below behavior_error (u / behavior_error is then
+    itself uniform and gives the rate).
+    """
+    error = u < behavior_error
+    with np.errstate(divide='ignore', invalid='ignore'):
+        random_choice = np.minimum((u / behavior_error * num_rates).astype(int), num_rates - 1)
+    return np.where(error, random_choice, choice)
+
+
+def position(possible_utilities, choice):
+    """First tax rate with the utility of the chosen one, as NetLogo's
+    position reports it.
+    """
+    best_utility = np.take_along_axis(possible_utilities, choice[..., None], axis=-1)
+    return (possible_utilities == best_utility).argmax(axis=-1)
+
+
+def netlogo_round(x):
+    """NetLogo round: halves are rounded up."""
+    return np.floor(np.asarray(x) + 0.5).astype(int)
+
+
+def run(params, steps=3, seed=None, run_number=1, **options):
+    """Run the model like a BehaviorSpace experiment with
+    runMetricsEveryStep, for params given as NetLogo variable names.
+    Returns list of table rows (dicts), one per step 0..steps.
+    """
+    return run_batch([params], steps, [seed], [run_number], **options)
+
+
+def run_batch(params, steps=3, seeds=None, run_numbers=None, batch=None, **options):
+    """Run replicates (one dict of NetLogo variables each) together with
+    batch, RedistributionBatch by default (options are its keyword
+    arguments). Returns table rows ordered by run, then step.
+    """
+    if seeds is None:
+        seeds = np.random.SeedSequence().spawn(len(params))
+    if run_numbers is None:
+        run_numbers = range(1, len(params) + 1)
+    model = (batch or RedistributionBatch)(params, seeds, **options)
+    model.setup()
+    steps_rows = [_get_rows(model, params, run_numbers)]
+    for i in range(steps):
+        model.go()
+        steps_rows.append(_get_rows(model, params, run_numbers))
+    return [rows[r] for r in range(len(params)) for rows in steps_rows]
+
+
+def _get_rows(model, params, run_numbers):
+    rows = []
+    for r, (p, run_number) in enumerate(zip(params, run_numbers)):
+        row = {'[run number]': run_number}
+        row.update(p)
+        row['[step]'] = model.ticks
+        row.update(model.report(r))
+        rows.append(row)
+    return rows
+
+
+def write_table(rows, path, experiment='', model='redistribution_model.nlogo', stamp=None):
+    """Write rows in the BehaviorSpace table format (6 lines of run
+    information, then one quoted csv line per run and step).
+    stamp is the time in the run information, now by default.
+    """
+    df = pd.DataFrame(rows)
+    for col in df.columns:
+        df[col] = [format_value(i) for i in df[col]]
+    stamp = stamp or get_stamp()
+    header = ['BehaviorSpace results (redistribution_model.py)', model, experiment,
+              stamp, 'min-pxcor,max-pxcor,min-pycor,max-pycor', '-16,16,-16,16']
+    with open(path, 'w', newline='') as f:
+        for line in header:
+            f.write(','.join('"{}"'.format(i) for i in line.split(',')) + '\n')
+        df.to_csv(f, index=False, quoting=csv.QUOTE_ALL, lineterminator='\n')
+
+
+def format_value(value):
+    """Format a value as NetLogo prints it: whole numbers without decimals,
+    lists in brackets, booleans in lower case.
+    """
+    if isinstance(value, (bool, np.bool_)):
+        return str(value).lower()
+    if isinstance(value, (list, tuple, np.ndarray)):
+        return '[' + ' '.join(format_value(i) for i in value) + ']'
+    if isinstance(value, (float, np.floating)):
+        if float(value).is_integer():
+            return str(int(value))
+        return repr(float(value))
+    return str(value)
+
+
+def check_equivalence(df_netlogo, df_engine, measures=('gini', 'median_vote', 'vote_mad',
+                                                      'vote_kurt', 'assortativity'),
+                      treatment=('h', 'v')):
+    """Compare run-level outcomes of NetLogo and engine runs (both read with
+    get_sim_data) per treatment and period: mean of each and two-sample
+    Kolmogorov-Smirnov p-value. Returns long dataframe.
+    """
+    keys = list(treatment) + ['period']
+    res = []
+    engine = dict(list(df_engine.groupby(keys, observed=True)))
+    for cell, x in df_netlogo.groupby(keys, observed=True):
+        if cell not in engine:
+            continue
+        y = engine[cell]
+        for m in measures:
+            a, b = x[m].dropna(), y[m].dropna()
+            p = ks_2samp(a, b).pvalue if len(a) and len(b) else np.nan
+            res.append(list(cell) + [m, a.mean(), b.mean(), p])
+    return pd.DataFrame(res, columns=keys + ['measure', 'netlogo_mean', 'engine_mean', 'ks_pvalue'])
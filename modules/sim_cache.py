@@ -0,0 +1,149 @@
+"""
+Created on Oct 17 2026
+@author: LSE Social Research Lab
+Purpose: Persistent columnar cache for parsed simulation tables
+Each parsed table is stored as a bundle directory of .npy files, one per
+column (list columns as 2-D arrays rows x agents), plus a meta.json.
+Bundles are keyed by the content hash of the source csv and a reader version,
+and are memory-mapped when loaded.
+"""
+
+import os
+import json
+import shutil
+import hashlib
+import numpy as np
+import pandas as pd
+
+META = 'meta.json'
+HASHES = 'hashes.json'
+HASH_BLOCK = 1 << 24
+
+
+def get_cached(path, build, cache_dir, name='table', version=''):
+    """Return the table parsed from path, from cache_dir if possible.
+    build(path) parses the csv on a cache miss and its result is stored.
+    name tells apart different parses of the same file. A bundle is only 
+    reused if both the file content and version match; bundles of the same
+    file (same path) and name with another key are removed.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    key = hashlib.sha256('{}:{}'.format(file_hash(path, cache_dir), version)
+                         .encode()).hexdigest()[:16]
+    # The directory's hash tells apart tables of the same name
+    folder = hashlib.sha256(os.path.dirname(os.path.abspath(path)).encode()).hexdigest()[:8]
+    prefix = '{}.{}.{}-'.format(os.path.basename(path), folder, name)
+    bundle = os.path.join(cache_dir, prefix + key)
+
+    if os.path.exists(os.path.join(bundle, META)):
+        return load_bundle(bundle)
+
+    for i in os.listdir(cache_dir):
+        if i.startswith(prefix) and i != prefix + key:
+            shutil.rmtree(os.path.join(cache_dir, i), ignore_errors=True)
+
+    df = build(path)
+    save_bundle(df, bundle)
+    return load_bundle(bundle)
+
+
+def file_hash(path, cache_dir=None):
+    """SHA-256 of the file content. If cache_dir is given, the hash is
+    remembered there and reused while the file's size and mtime are unchanged.
+    """
+    stat = os.stat(path)
+    stamp = [stat.st_size, stat.st_mtime_ns]
+    hashes = {}
+    if cache_dir:
+        hashes_file = os.path.join(cache_dir, HASHES)
+        if os.path.exists(hashes_file):
+            with open(hashes_file) as f:
+                hashes = json.load(f)
+        known = hashes.get(os.path.abspath(path))
+        if known and known['stamp'] == stamp:
+            return known['sha256']
+
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(HASH_BLOCK), b''):
+            sha.update(block)
+    digest = sha.hexdigest()
+
+    if cache_dir:
+        hashes[os.path.abspath(path)] = {'stamp': stamp, 'sha256': digest}
+        write_json(hashes, hashes_file)
+    return digest
+
+
+def save_bundle(df, bundle):
+    """Write df as a bundle of .npy columns. Columns holding one array per
+    row (decoded NetLogo lists) are stacked into 2-D arrays. Categorical and
+    string columns are stored as integer codes with their categories.
+    The bundle is written to a temporary directory and moved into place.
+    """
+    tmp = bundle + '.tmp'
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+
+    meta = {'columns': []}
+    for i, col in enumerate(df.columns):
+        values = df[col]
+        info = {'name': col, 'file': '{}.npy'.format(i), 'list': False}
+        if values.dtype == object and len(values) and isinstance(values.iloc[0], np.ndarray):
+            info['list'] = True
+            values = np.vstack(values.to_numpy())
+            if values.dtype == object:
+                values = _encode_matrix(values, info)
+        elif isinstance(values.dtype, pd.CategoricalDtype) or values.dtype == object:
+            cat = pd.Categorical(values)
+            info['categories'] = cat.categories.tolist()
+            values = cat.codes
+        else:
+            values = values.to_numpy()
+        np.save(os.path.join(tmp, info['file']), values)
+        meta['columns'].append(info)
+    np.save(os.path.join(tmp, 'index.npy'), df.index.to_numpy())
+    write_json(meta, os.path.join(tmp, META))
+
+    shutil.rmtree(bundle, ignore_errors=True)
+    os.replace(tmp, bundle)
+
+
+def load_bundle(bundle, mmap=True):
+    """Read a bundle written by save_bundle into a dataframe.
+    With mmap, numeric arrays are memory-mapped read-only from disk.
+    """
+    with open(os.path.join(bundle, META)) as f:
+        meta = json.load(f)
+    mode = 'r' if mmap else None
+
+    data = {}
+    for info in meta['columns']:
+        values = np.load(os.path.join(bundle, info['file']), mmap_mode=mode)
+        if 'categories' in info:
+            if info['list']:
+                values = np.asarray(info['categories'], dtype=object)[values]
+            else:
+                values = pd.Categorical.from_codes(values, info['categories'])
+        if info['list']:
+            values = list(values)
+        data[info['name']] = values
+    index = np.load(os.path.join(bundle, 'index.npy'))
+    return pd.DataFrame(data, index=index, columns=[i['name'] for i in meta['columns']])
+
+
+def _encode_matrix(values, info):
+    """Integer codes for a 2-D object array, categories stored in info."""
+    categories, codes = np.unique(values.astype(str), return_inverse=True)
+    info['categories'] = categories.tolist()
+    return codes.reshape(values.shape).astype(np.int8 if len(categories) < 128 else np.int32)
+
+
+def write_json(data, path):
+    """Write data as json to path through a temporary file, so readers
+    never see a partly written file.
+    """
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(data, f)
+    os.replace(tmp, path)
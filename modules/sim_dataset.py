@@ -0,0 +1,147 @@
+"""
+Created on Oct 17 2026
+@author: LSE Social Research Lab
+Purpose: Lazy access to BehaviorSpace table output
+Only scalar columns are read up front. List columns are decoded on first
+access and only for the rows left after filtering by treatment and period.
+"""
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import is_list_like
+from read_netlogo_data import (SIM_COLS, SIM_EXP_COLS, LIST_COLS, RECODE_NETS,
+                               NET_CATS, get_array_from_strs,
+                               get_status_array_from_strs, get_run_metrics,
+                               is_list_col, narrow_votes)
+
+# BehaviorSpace tables have 6 lines of run information before the header
+HEADER_LINE = 6
+
+
+class SimDataset:
+    """Rows of a BehaviorSpace table indexed by (run, h, v, period),
+    or (run, network_type, period) for the experiment model (exp=True).
+
+    ds = SimDataset('sim-data/high-ineq-table_1.csv')
+    votes = ds.filter(h=1, v=-1, period=0)['votes']  # 2-D array rows x agents,
+                                                     # plain numbers repeated
+    df = ds.to_frame()                               # same as get_sim_data
+    """
+
+    def __init__(self, dirname, exp=False):
+        self.dirname = dirname
+        self.exp = exp
+        self.columns = SIM_EXP_COLS if exp else SIM_COLS
+
+        scalars = {i: j for i, j in self.columns.items() if not is_list_col(j)}
+        rows = pd.read_csv(dirname, header=HEADER_LINE, usecols=list(scalars))
+        rows = rows[list(scalars)]
+        rows.columns = list(scalars.values())
+        # Position of the row in the data part of the file
+        rows['_row'] = np.arange(len(rows))
+        if exp:
+            rows = rows[rows['network_type'] != 'equal'] # Remove 4-4 for analyses
+            rows['network_type'] = rows['network_type'].replace(RECODE_NETS)
+            rows['network_type'] = rows['network_type'].astype(NET_CATS)
+
+        self._rows = rows.reset_index(drop=True)
+        self._lists = {}
+
+    @property
+    def keys(self):
+        if self.exp:
+            return ['run', 'network_type', 'period']
+        return ['run', 'h', 'v', 'period']
+
+    @property
+    def index(self):
+        return pd.MultiIndex.from_frame(self._rows[self.keys])
+
+    @property
+    def scalars(self):
+        """Scalar columns of the selected rows."""
+        return self._rows.drop(columns='_row').set_index(self.index)
+
+    def __len__(self):
+        return len(self._rows)
+
+    def __getitem__(self, col):
+        """Scalar column as 1-D array or decoded list column as 2-D array."""
+        if col in self._rows.columns and col != '_row':
+            return self._rows[col].to_numpy()
+        return self.get_lists([col])[col]
+
+    def filter(self, **conditions):
+        """New dataset with the rows whose columns take the given values,
+        e.g. filter(h=1, v=[-1, -0.5], period=0). Already decoded list
+        columns are sliced, the others are only read for the kept rows.
+        """
+        mask = np.ones(len(self), dtype=bool)
+        for col, value in conditions.items():
+            values = value if is_list_like(value) else [value]
+            mask &= self._rows[col].isin(values).to_numpy()
+
+        ds = object.__new__(SimDataset)
+        ds.dirname = self.dirname
+        ds.exp = self.exp
+        ds.columns = self.columns
+        ds._rows = self._rows[mask].reset_index(drop=True)
+        ds._lists = {col: values[mask] for col, values in self._lists.items()}
+        return ds
+
+    def get_lists(self, cols):
+        """Decoded list columns for the selected rows, as dict of 2-D arrays.
+        Columns not decoded yet are read together in one scan that skips
+        all other rows of the file.
+        """
+        missing = [i for i in cols if i not in self._lists]
+        if missing:
+            self._read_lists(missing)
+        return {i: self._lists[i] for i in cols}
+
+    def to_frame(self, metrics=True):
+        """Selected rows with all list columns, as get_sim_data or
+        get_sim_data_exp return them (with their metrics if metrics).
+        """
+        df = self._rows.set_index('_row')
+        df.index.name = None
+        lists = self.get_lists([j for j in self.columns.values() if is_list_col(j)])
+        for col, values in lists.items():
+            df[col] = list(values)
+        df = df[list(self.columns.values())]
+
+        if metrics:
+            results = get_run_metrics(lists['wealths'], lists['observed_mean_wealth'],
+                                      lists['votes'])
+            for col, values in results.items():
+                df[col] = values
+        return df
+
+    def _read_lists(self, cols):
+        names = {j: i for i, j in self.columns.items()}
+        # Line numbers in the file of the selected rows
+        keep = set((self._rows['_row'] + HEADER_LINE + 1).tolist())
+        raw = pd.read_csv(self.dirname, header=HEADER_LINE,
+                          usecols=[names[i] for i in cols],
+                          skiprows=lambda i: i > HEADER_LINE and i not in keep)
+        for col in cols:
+            if col == 'statuses':
+                self._lists[col] = get_status_array_from_strs(raw[names[col]])
+            else:
+                self._lists[col] = get_array_from_strs(raw[names[col]], LIST_COLS[col])
+                if col == 'votes':
+                    self._lists[col] = narrow_votes(self._lists[col])
+
+        # Rows left may only hold plain numbers (votes in step 0)
+        for col in cols:
+            values = self._lists[col]
+            if values.ndim == 2 and values.shape[1] == 1 and len(self):
+                num_agents = self._get_num_agents()
+                if num_agents != 1:
+                    self._lists[col] = np.repeat(values, num_agents, axis=1)
+
+    def _get_num_agents(self):
+        """Number of agents, from population-size or the width of wealths."""
+        if 'pop_size' in self._rows.columns and self._rows['pop_size'].nunique() == 1:
+            return int(self._rows['pop_size'].iloc[0])
+        return self.get_lists(['wealths'])['wealths'].shape[1]
@@ -0,0 +1,195 @@
+"""
+Created on Oct 17 2026
+@author: LSE Social Research Lab
+Purpose: Typed binary store for per-step simulation output
+A store is a directory of row groups, .npz files of typed columns written
+while a sweep runs, and a meta.json with the run information of the
+BehaviorSpace table. NetLogo list metrics are kept as 2-D arrays (rows x
+agents), float32 and votes as uint8, so they are read back without any
+string decoding. get_sim_data and get_sim_data_exp read stores as tables.
+
+    with StoreWriter('high-ineq-store', 'high-ineq') as store:
+        store.write(rows)       # e.g. from redistribution_model.run_batch
+    df = get_sim_data('high-ineq-store')
+"""
+
+import os
+import json
+import datetime
+import numpy as np
+import pandas as pd
+from sim_cache import write_json
+
+META = 'meta.json'
+
+# Rows per row group
+ROW_GROUP_SIZE = 1000
+
+# Types of the NetLogo list metrics; votes that are not whole numbers
+# (tax_step below 1) are stored as float32
+LIST_DTYPES = {'num-observers': np.int32, 'observed-mean-wealth': np.float32,
+               'observed-gini': np.float32, 'observed-subj-ineq': np.float32,
+               'statuses': np.uint8, 'wealths': np.float32, 'utilities': np.float32,
+               'votes': np.uint8}
+
+# Values of statuses by code
+STATUSES = ['poor', 'rich']
+
+
+class StoreWriter:
+    """Writes table rows (dicts of BehaviorSpace columns, list metrics as
+    arrays) to a new store at path, one row group per row_group_size rows.
+    meta.json is updated after every row group, so the store can be read
+    while the run goes on.
+    """
+
+    def __init__(self, path, experiment='', model='redistribution_model.nlogo',
+                 row_group_size=ROW_GROUP_SIZE, stamp=None):
+        if is_store(path):
+            raise ValueError('{} already holds a store'.format(path))
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.row_group_size = row_group_size
+        self.meta = {'model': model, 'experiment': experiment, 'stamp': stamp or get_stamp(),
+                     'columns': None, 'statuses': STATUSES, 'num_agents': None,
+                     'groups': [], 'num_rows': 0}
+        self._rows = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def write(self, rows):
+        self._rows.extend(rows)
+        while len(self._rows) >= self.row_group_size:
+            self._write_group(self._rows[:self.row_group_size])
+            self._rows = self._rows[self.row_group_size:]
+
+    def close(self):
+        """Write the rows left and the final meta.json."""
+        if self._rows:
+            self._write_group(self._rows)
+            self._rows = []
+        write_json(self.meta, os.path.join(self.path, META))
+
+    def _write_group(self, rows):
+        columns = list(rows[0])
+        if self.meta['columns'] is None:
+            self.meta['columns'] = columns
+        elif columns != self.meta['columns']:
+            raise ValueError('Rows have other columns than the store')
+
+        num_agents = self._get_num_agents(rows)
+        data = {}
+        for i, col in enumerate(columns):
+            values = [row[col] for row in rows]
+            if col in LIST_DTYPES:
+                data['c{}'.format(i)] = _to_typed(col, values, num_agents)
+            else:
+                data['c{}'.format(i)] = np.asarray(values)
+
+        group = 'group-{:05d}.npz'.format(len(self.meta['groups']))
+        tmp = os.path.join(self.path, group + '.tmp')
+        with open(tmp, 'wb') as f:
+            np.savez(f, **data)
+        os.replace(tmp, os.path.join(self.path, group))
+        self.meta['groups'].append(group)
+        self.meta['num_rows'] += len(rows)
+        write_json(self.meta, os.path.join(self.path, META))
+
+    def _get_num_agents(self, rows):
+        """Width of the list metrics: population-size, else the length of
+        the lists in rows, else that of the groups written before (a group
+        may only hold plain numbers, e.g. votes before the first vote).
+        """
+        if 'population-size' in rows[0]:
+            sizes = {int(row['population-size']) for row in rows}
+        else:
+            sizes = {np.size(row[col]) for row in rows for col in LIST_DTYPES
+                     if col in row and np.ndim(row[col])}
+        if len(sizes) > 1:
+            raise ValueError('Rows of a row group have {} to {} agents'
+                             .format(min(sizes), max(sizes)))
+        if sizes:
+            self.meta['num_agents'] = sizes.pop()
+        return self.meta['num_agents'] or 1
+
+
+def get_stamp():
+    """Current time as BehaviorSpace writes it."""
+    return datetime.datetime.now().strftime('%m/%d/%Y %H:%M:%S:%f')[:-3]
+
+
+def is_store(path):
+    return os.path.isfile(os.path.join(path, META))
+
+
+def read_meta(path):
+    with open(os.path.join(path, META)) as f:
+        return json.load(f)
+
+
+def read_store(path, columns=None):
+    """Dataframe of the store's rows (in the order written) with the
+    BehaviorSpace columns, all or those in columns. List metrics hold one
+    array per row, a view into the column's 2-D array.
+    """
+    meta = read_meta(path)
+    return _read_groups(path, meta, meta['groups'], columns)
+
+
+def iter_store(path, columns=None, groups_per_chunk=1):
+    """Yield the rows of the store as dataframes of groups_per_chunk row
+    groups each (see read_store).
+    """
+    meta = read_meta(path)
+    groups = meta['groups']
+    for start in range(0, len(groups), groups_per_chunk):
+        yield _read_groups(path, meta, groups[start:start + groups_per_chunk], columns)
+
+
+def _read_groups(path, meta, groups, columns):
+    columns = list(columns or meta['columns'] or [])
+    # A store without rows has no columns yet and reads as empty
+    missing = [i for i in columns if i not in (meta['columns'] or columns)]
+    if missing:
+        raise ValueError('Columns not in {}: {}'.format(path, ', '.join(missing)))
+    data = {col: [] for col in columns}
+    for group in groups:
+        with np.load(os.path.join(path, group)) as f:
+            for col in columns:
+                data[col].append(f['c{}'.format(meta['columns'].index(col))])
+
+    df = {}
+    for col, values in data.items():
+        if col in LIST_DTYPES:
+            if len({i.shape[1] for i in values}) > 1:
+                raise ValueError('Ragged list column {} in {}'.format(col, path))
+            matrix = np.concatenate(values) if values else np.empty((0, 0), LIST_DTYPES[col])
+            if col == 'statuses':
+                matrix = np.asarray(meta['statuses'], dtype=object)[matrix]
+            df[col] = list(matrix)
+        else:
+            df[col] = np.concatenate(values) if values else []
+    return pd.DataFrame(df, columns=columns)
+
+
+def _to_typed(col, values, width):
+    """2-D array (rows x width agents) of a list metric in its store type.
+    Plain numbers (votes before the first vote) are repeated across the row.
+    """
+    if col == 'statuses':
+        codes = {j: i for i, j in enumerate(STATUSES)}
+        return np.array([[codes[j] for j in i] for i in values], dtype=LIST_DTYPES[col])
+    matrix = np.empty((len(values), width))
+    for i, value in enumerate(values):
+        if np.ndim(value) and np.size(value) != width:
+            raise ValueError('Ragged list column {}: {} values for {} agents'
+                             .format(col, np.size(value), width))
+        matrix[i] = value
+    typed = matrix.astype(LIST_DTYPES[col])
+    if col == 'votes' and not np.array_equal(typed, matrix):
+        typed = matrix.astype(np.float32)
+    return typed
@@ -0,0 +1,386 @@
+"""
+Created on Oct 17 2026
+@author: LSE Social Research Lab
+Purpose: BehaviorSpace experiments run with the NumPy engine
+read_experiments parses the <experiments> of a .nlogo file. get_jobs expands
+an experiment into runs (combinations of enumerated values x repetitions),
+each with a seed derived from one master seed and its run number, so any
+run can be repeated on its own. run_experiment runs them on a process pool,
+replicates with the same population-size and num-observed together as one
+batch, and writes a BehaviorSpace table or a typed binary store (see
+sim_store; both read with get_sim_data or get_sim_data_exp) or stores the
+analysis dataframe in the sim_cache format.
+With a checkpoint directory, finished batches of runs are saved there with a
+ledger, and a restarted sweep only runs what is missing. run_adaptive runs
+replicates of every combination in rounds until the confidence intervals of
+chosen outcomes are narrow enough.
+"""
+
+import os
+import json
+import pickle
+import hashlib
+import itertools
+import xml.etree.ElementTree as ET
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+import pandas as pd
+from scipy.stats import t as t_dist
+from redistribution_model import (RedistributionBatch, ExperimentBatch, run_batch,
+                                  write_table)
+from read_netlogo_data import (get_sim_data, get_sim_data_exp, get_sim_data_from_rows,
+                               get_array_from_lists, get_run_metrics, READER_VERSION)
+from sim_cache import save_bundle, load_bundle, write_json
+from sim_store import StoreWriter, get_stamp
+
+# Engine of each NetLogo model, by file name
+MODELS = {'redistribution_model.nlogo': RedistributionBatch,
+          'redistribution_experiment.nlogo': ExperimentBatch}
+
+# Runs per pool task; they are run together as one batch
+JOBS_PER_TASK = 50
+
+# Variables that must be the same within a batch
+SHARED = ['population-size', 'num-observed', 'probabilistic?']
+
+LEDGER = 'ledger.json'
+
+# Target half-width of the confidence interval of run outcomes in run_adaptive
+PRECISION = {'median_vote': 1.0, 'gini': 0.005, 'vote_mad': 1.0}
+
+
+def read_experiments(path):
+    """Experiments of a .nlogo file as dict name -> dict with repetitions,
+    steps (timeLimit, None if unlimited), metrics, run_every_step and
+    values (dict variable -> list of enumerated values, in file order).
+    """
+    with open(path) as f:
+        text = f.read()
+    start, end = text.find('<experiments>'), text.find('</experiments>')
+    if start < 0:
+        return {}
+    root = ET.fromstring(text[start:end + len('</experiments>')])
+
+    experiments = {}
+    for exp in root.iter('experiment'):
+        limit = exp.find('timeLimit')
+        values = {}
+        for value_set in exp.iter('enumeratedValueSet'):
+            values[value_set.get('variable')] = [parse_value(i.get('value'))
+                                                 for i in value_set.iter('value')]
+        for value_set in exp.iter('steppedValueSet'):
+            first, step, last = [float(value_set.get(i)) for i in ['first', 'step', 'last']]
+            values[value_set.get('variable')] = list(np.arange(first, last + step / 2, step))
+        experiments[exp.get('name')] = {
+            'name': exp.get('name'),
+            'repetitions': int(exp.get('repetitions', 1)),
+            'run_every_step': exp.get('runMetricsEveryStep') == 'true',
+            'steps': int(limit.get('steps')) if limit is not None else None,
+            'metrics': [i.text for i in exp.iter('metric')],
+            'values': values}
+    return experiments
+
+
+def parse_value(text):
+    """Python value of a NetLogo literal: "string", true/false or number."""
+    if text.startswith('"') and text.endswith('"'):
+        return text[1:-1]
+    if text in ('true', 'false'):
+        return text == 'true'
+    number = float(text)
+    return int(number) if number.is_integer() and '.' not in text else number
+
+
+def get_jobs(experiment, master_seed=0, repetitions=None):
+    """Runs of an experiment as list of (run number, params, seed), numbered
+    from 1 over the combinations of values (first variable slowest) with
+    the repetitions of a combination next to each other.
+    """
+    repetitions = repetitions or experiment['repetitions']
+    names = list(experiment['values'])
+    jobs = []
+    for combination in itertools.product(*experiment['values'].values()):
+        for i in range(repetitions):
+            run_number = len(jobs) + 1
+            jobs.append((run_number, dict(zip(names, combination)),
+                         get_seed(master_seed, run_number)))
+    return jobs
+
+
+def get_seed(master_seed, run_number):
+    """Seed of a run, independent of which other runs are done."""
+    return np.random.SeedSequence(master_seed, spawn_key=(run_number,))
+
+
+def run_jobs(jobs, steps, model='redistribution_model.nlogo', workers=None,
+             jobs_per_task=JOBS_PER_TASK, checkpoint_dir=None, writer=None,
+             every_step=True):
+    """Run jobs from get_jobs for steps steps on a pool of workers
+    processes (all cores by default; 1 runs in this process).
+    With checkpoint_dir (see open_ledger), the rows of every finished task
+    are saved there and runs already in its ledger are skipped.
+    Returns table rows ordered by run number, then step (only the last
+    step unless every_step). With writer (a sim_store.StoreWriter), the
+    rows of every finished task are written to it as they come instead.
+    """
+    results = []
+    if checkpoint_dir:
+        done = set(read_ledger(checkpoint_dir)['runs'])
+        jobs = [i for i in jobs if i[0] not in done]
+
+    def collect(rows):
+        if not every_step:
+            rows = [i for i in rows if i['[step]'] == steps]
+        if checkpoint_dir:
+            save_part(rows, checkpoint_dir)
+        elif writer:
+            writer.write(rows)
+        else:
+            results.append(rows)
+
+    tasks = [(model, chunk, steps) for chunk in _get_chunks(jobs, jobs_per_task)]
+    if workers == 1:
+        for task in tasks:
+            collect(_run_task(task))
+    elif tasks:
+        with ProcessPoolExecutor(workers or os.cpu_count()) as pool:
+            for future in as_completed([pool.submit(_run_task, i) for i in tasks]):
+                collect(future.result())
+
+    if checkpoint_dir:
+        results = load_parts(checkpoint_dir)
+    rows = sorted([row for result in results for row in result],
+                  key=lambda i: (i['[run number]'], i['[step]']))
+    if writer:
+        writer.write(rows)
+        return []
+    return rows
+
+
+def run_experiment(path, name, master_seed=0, out=None, cache_dir=None, workers=None,
+                   repetitions=None, checkpoint_dir=None, binary=False):
+    """Run experiment name of the .nlogo file at path like BehaviorSpace
+    (metrics every step). The table is written to out if given
+    (default '{name}-table.csv' next to the model if neither out nor
+    cache_dir is). With binary, out is instead a typed binary store
+    (default '{name}-store'), written as the runs finish, in that order.
+    With cache_dir the parsed dataframe is stored there
+    and reused when the same experiment and seed are run again.
+    With checkpoint_dir, an interrupted sweep continues where it stopped
+    when started again, and writes the same table as an uninterrupted one
+    (with the time it was first started).
+    Returns the dataframe (cache_dir) or the table path.
+    """
+    model = os.path.basename(path)
+    experiment = read_experiments(path)[name]
+    # Binary stores hold float32 wealths, so their dataframes are cached apart
+    key = hashlib.sha256(json.dumps([model, experiment, master_seed, repetitions,
+                                     READER_VERSION] + (['binary'] if binary else []))
+                         .encode()).hexdigest()[:16]
+    bundle = None
+    if cache_dir:
+        bundle = os.path.join(cache_dir, '{}.{}-{}'.format(model, name, key))
+        if os.path.exists(os.path.join(bundle, 'meta.json')):
+            return load_bundle(bundle)
+
+    if experiment['steps'] is None:
+        raise ValueError('Experiment {} has no timeLimit'.format(name))
+    stamp = None
+    if checkpoint_dir:
+        stamp = open_ledger(checkpoint_dir, key)['stamp']
+    jobs = get_jobs(experiment, master_seed, repetitions)
+    if binary:
+        out = out or os.path.join(os.path.dirname(path), '{}-store'.format(name))
+        with StoreWriter(out, name, model, stamp=stamp) as writer:
+            run_jobs(jobs, experiment['steps'], model, workers,
+                     checkpoint_dir=checkpoint_dir, writer=writer,
+                     every_step=experiment['run_every_step'])
+        if not cache_dir:
+            return out
+        os.makedirs(cache_dir, exist_ok=True)
+        save_bundle(get_sim_data_exp(out) if MODELS[model] is ExperimentBatch
+                    else get_sim_data(out), bundle)
+        return load_bundle(bundle)
+
+    rows = run_jobs(jobs, experiment['steps'], model, workers, checkpoint_dir=checkpoint_dir,
+                    every_step=experiment['run_every_step'])
+    if out or not cache_dir:
+        out = out or os.path.join(os.path.dirname(path), '{}-table.csv'.format(name))
+        write_table(rows, out, name, model, stamp)
+    if not cache_dir:
+        return out
+    os.makedirs(cache_dir, exist_ok=True)
+    save_bundle(get_sim_data_from_rows(rows, MODELS[model] is ExperimentBatch), bundle)
+    return load_bundle(bundle)
+
+
+def run_adaptive(path, name, precision=PRECISION, master_seed=0, batch_size=10,
+                 min_repetitions=10, max_repetitions=None, level=0.95, period=None,
+                 out=None, cache_dir=None, workers=None):
+    """Run experiment name with as many repetitions per combination of
+    values as needed: min_repetitions first, then batch_size more in every
+    round for the combinations where the level confidence interval of the
+    mean of some outcome in precision (dict outcome -> half-width) at
+    period (last step by default) is still wider, up to max_repetitions
+    (twice the experiment's repetitions by default). Run numbers and seeds
+    are those of the fixed design with max_repetitions, so every run is the
+    same as there.
+    Writes the table to out and/or stores the dataframe in cache_dir as
+    run_experiment. Returns (table path or dataframe, report), report a
+    dataframe with runs, half-widths and convergence per combination and
+    attrs runs, fixed_runs (experiment's repetitions, at most
+    max_repetitions, for all), runs_saved (by combinations that converged
+    with fewer runs than that) and runs_extra (by those that needed more).
+    """
+    model = os.path.basename(path)
+    experiment = read_experiments(path)[name]
+    steps = experiment['steps']
+    if steps is None:
+        raise ValueError('Experiment {} has no timeLimit'.format(name))
+    period = steps if period is None else period
+    max_repetitions = max_repetitions or 2 * experiment['repetitions']
+    cell_jobs = _get_chunks(get_jobs(experiment, master_seed, max_repetitions),
+                            max_repetitions, shared=False)
+
+    done = np.zeros(len(cell_jobs), dtype=int)
+    active = np.ones(len(cell_jobs), dtype=bool)
+    rows, outcomes = [], []
+    while active.any():
+        size = np.where(done == 0, min_repetitions, batch_size)
+        batch = [job for c in np.flatnonzero(active)
+                 for job in cell_jobs[c][done[c]:done[c] + size[c]]]
+        new_rows = run_jobs(batch, steps, model, workers)
+        rows += new_rows
+        outcomes.append(get_outcomes(new_rows, period))
+        done = np.where(active, np.minimum(done + size, max_repetitions), done)
+
+        runs = pd.concat(outcomes)
+        cells = (runs.index.to_numpy() - 1) // max_repetitions
+        widths = _get_half_widths(runs[list(precision)], cells, len(cell_jobs), level)
+        converged = (widths <= pd.Series(precision)).all(axis=1).to_numpy()
+        active = ~converged & (done < max_repetitions)
+
+    rows = sorted(rows, key=lambda i: (i['[run number]'], i['[step]']))
+    if not experiment['run_every_step']:
+        rows = [i for i in rows if i['[step]'] == steps]
+    if out or not cache_dir:
+        out = out or os.path.join(os.path.dirname(path), '{}-table.csv'.format(name))
+        write_table(rows, out, name, model)
+    result = out
+    if cache_dir:
+        os.makedirs(cache_dir, exist_ok=True)
+        key = hashlib.sha256(json.dumps([model, experiment, master_seed, precision,
+                                         batch_size, min_repetitions, max_repetitions,
+                                         level, period, READER_VERSION])
+                             .encode()).hexdigest()[:16]
+        bundle = os.path.join(cache_dir, '{}.{}-adaptive-{}'.format(model, name, key))
+        save_bundle(get_sim_data_from_rows(rows, MODELS[model] is ExperimentBatch), bundle)
+        result = load_bundle(bundle)
+
+    report = pd.DataFrame([job[0][1] for job in cell_jobs])
+    report['runs'] = done
+    report = pd.concat([report, widths.add_suffix('_ci')], axis=1)
+    report['converged'] = converged
+    report.attrs['runs'] = int(done.sum())
+    # Without adaptive stopping every combination runs up to max_repetitions
+    fixed = min(experiment['repetitions'], max_repetitions)
+    report.attrs['fixed_runs'] = fixed * len(cell_jobs)
+    report.attrs['runs_saved'] = int(np.maximum(fixed - done, 0).sum())
+    report.attrs['runs_extra'] = int(np.maximum(done - fixed, 0).sum())
+    return result, report
+
+
+def get_outcomes(rows, period):
+    """Run outcomes at period from table rows: median_vote, gini and the
+    run metrics of get_run_metrics, indexed by run number.
+    """
+    rows = [i for i in rows if i['[step]'] == period]
+    lists = {i: get_array_from_lists([j[i] for j in rows])
+             for i in ['wealths', 'observed-mean-wealth', 'votes']}
+    outcomes = pd.DataFrame({'median_vote': [i['median-vote'] for i in rows],
+                             'gini': [i['gini'] for i in rows]},
+                            index=[i['[run number]'] for i in rows])
+    metrics = get_run_metrics(lists['wealths'], lists['observed-mean-wealth'], lists['votes'])
+    for col, values in metrics.items():
+        outcomes[col] = values
+    return outcomes
+
+
+def _get_half_widths(outcomes, cells, num_cells, level):
+    """Half-width of the level confidence interval (t distribution) of the
+    mean of every outcome per cell; inf with fewer than 2 runs and NaN
+    where the outcome is undefined, so neither counts as converged.
+    """
+    grouped = outcomes.groupby(cells)
+    n = grouped.count().reindex(range(num_cells), fill_value=0)
+    sd = grouped.std().reindex(range(num_cells))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        widths = t_dist.ppf((1 + level) / 2, n - 1) * sd / np.sqrt(n)
+    return widths.where(n > 1, np.inf)
+
+
+def open_ledger(checkpoint_dir, key):
+    """Ledger of the sweep identified by key in checkpoint_dir, created
+    if there is none: dict with key, stamp (start time), runs (finished run
+    numbers) and parts (files of saved rows). Raises ValueError if the
+    directory holds another sweep.
+    """
+    os.makedirs(checkpoint_dir, exist_ok=True)
+    if os.path.exists(os.path.join(checkpoint_dir, LEDGER)):
+        ledger = read_ledger(checkpoint_dir)
+        if ledger['key'] != key:
+            raise ValueError('{} holds checkpoints of another sweep'.format(checkpoint_dir))
+        return ledger
+    ledger = {'key': key, 'stamp': get_stamp(), 'runs': [], 'parts': []}
+    write_json(ledger, os.path.join(checkpoint_dir, LEDGER))
+    return ledger
+
+
+def read_ledger(checkpoint_dir):
+    with open(os.path.join(checkpoint_dir, LEDGER)) as f:
+        return json.load(f)
+
+
+def save_part(rows, checkpoint_dir):
+    """Save the rows of finished runs as a new part, then record their run
+    numbers in the ledger. Both writes are atomic, so after a crash a run is
+    either in the ledger with its rows or done again.
+    """
+    ledger = read_ledger(checkpoint_dir)
+    runs = sorted({i['[run number]'] for i in rows})
+    part = 'part-{:08d}.pkl'.format(runs[0])
+    tmp = os.path.join(checkpoint_dir, part + '.tmp')
+    with open(tmp, 'wb') as f:
+        pickle.dump(rows, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp, os.path.join(checkpoint_dir, part))
+    ledger['runs'] += runs
+    ledger['parts'].append(part)
+    write_json(ledger, os.path.join(checkpoint_dir, LEDGER))
+
+
+def load_parts(checkpoint_dir):
+    """Rows of all parts in the ledger, as one list per part."""
+    parts = []
+    for part in read_ledger(checkpoint_dir)['parts']:
+        with open(os.path.join(checkpoint_dir, part), 'rb') as f:
+            parts.append(pickle.load(f))
+    return parts
+
+
+def _get_chunks(jobs, size, shared=True):
+    """Jobs in chunks of at most size that share the SHARED variables
+    (all variables if not shared).
+    """
+    groups = {}
+    for job in jobs:
+        key = tuple(job[1].get(i) for i in SHARED) if shared else tuple(job[1].items())
+        groups.setdefault(key, []).append(job)
+    return [group[i:i + size] for group in groups.values()
+            for i in range(0, len(group), size)]
+
+
+def _run_task(task):
+    model, jobs, steps = task
+    run_numbers, params, seeds = zip(*jobs)
+    return run_batch(list(params), steps, list(seeds), list(run_numbers),
+                     batch=MODELS[model])
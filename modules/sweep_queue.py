@@ -0,0 +1,193 @@
+"""
+Created on Oct 17 2026
+@author: LSE Social Research Lab
+Purpose: Sweeps split into shards and run from a shared directory
+plan_shards writes a manifest of the sweep (experiment, values, master seed)
+and one file per shard, a range of run numbers, into queue_dir/todo.
+Workers on any machine that sees queue_dir claim shards by moving them to
+running (an atomic rename), touch the claim while the shard runs, write the
+shard's BehaviorSpace table to out and move the shard to done. merge_shards joins the tables into one. Runs keep
+the numbers and seeds of the whole sweep, so the merged table is the same as
+a single run_experiment and get_agent_data renumbers its runs the same way.
+
+    plan_shards('redistribution_model.nlogo', 'high-ineq', 'queue')
+    run_worker('queue')                   # on every node, as often as wanted
+    merge_shards('queue', 'high-ineq-table.csv')
+"""
+
+import os
+import time
+import json
+import socket
+import threading
+from sweep import read_experiments, get_jobs, run_jobs
+from redistribution_model import write_table
+from sim_cache import write_json
+
+MANIFEST = 'manifest.json'
+QUEUE_DIRS = ['todo', 'running', 'done', 'out']
+
+# Runs per shard
+SHARD_SIZE = 500
+
+# Seconds between touches of a running shard's claim, well below the
+# max_age of requeue_stale
+HEARTBEAT = 60
+
+
+def plan_shards(path, name, queue_dir, master_seed=0, shard_size=SHARD_SIZE,
+                repetitions=None, values=None):
+    """Split experiment name of the .nlogo file at path into shards of
+    shard_size runs in queue_dir. values (dict variable -> list) replaces
+    the enumerated values of the experiment, e.g. for sensitivity sweeps.
+    Returns the manifest.
+    """
+    experiment = read_experiments(path)[name]
+    if values:
+        experiment['values'] = {**experiment['values'], **values}
+    if repetitions:
+        experiment['repetitions'] = repetitions
+    if experiment['steps'] is None:
+        raise ValueError('Experiment {} has no timeLimit'.format(name))
+    if os.path.exists(os.path.join(queue_dir, MANIFEST)):
+        raise ValueError('{} already holds a sweep'.format(queue_dir))
+
+    num_runs = len(get_jobs(experiment, master_seed))
+    shards = [{'shard': '{:05d}'.format(i),
+               'runs': [start + 1, min(start + shard_size, num_runs)]}
+              for i, start in enumerate(range(0, num_runs, shard_size))]
+    manifest = {'model': os.path.basename(path), 'experiment': experiment,
+                'master_seed': master_seed, 'num_runs': num_runs, 'shards': shards}
+
+    for i in QUEUE_DIRS:
+        os.makedirs(os.path.join(queue_dir, i), exist_ok=True)
+    for shard in shards:
+        write_json(shard, os.path.join(queue_dir, 'todo', shard['shard'] + '.json'))
+    write_json(manifest, os.path.join(queue_dir, MANIFEST))
+    return manifest
+
+
+def run_worker(queue_dir, max_shards=None, workers=1):
+    """Run shards from queue_dir until none is left (or max_shards are
+    done), each on workers processes. Returns the ids of the shards run.
+    """
+    manifest = read_manifest(queue_dir)
+    jobs = get_jobs(manifest['experiment'], manifest['master_seed'])
+    done = []
+    while max_shards is None or len(done) < max_shards:
+        shard = claim_shard(queue_dir)
+        if shard is None:
+            break
+        first, last = shard['runs']
+        stop = threading.Event()
+        heartbeat = threading.Thread(target=_touch_claim, args=(shard['claim'], stop),
+                                     daemon=True)
+        heartbeat.start()
+        try:
+            rows = run_jobs(jobs[first - 1:last], manifest['experiment']['steps'],
+                            manifest['model'], workers)
+        finally:
+            stop.set()
+            heartbeat.join()
+        if not manifest['experiment']['run_every_step']:
+            rows = [i for i in rows if i['[step]'] == manifest['experiment']['steps']]
+        if _finish_shard(rows, queue_dir, shard, manifest):
+            done.append(shard['shard'])
+    return done
+
+
+def claim_shard(queue_dir):
+    """Move the next shard from todo to running. Returns the shard (with
+    the path of its claim) or None if there is none left.
+    """
+    todo = os.path.join(queue_dir, 'todo')
+    for i in sorted(os.listdir(todo)):
+        claim = os.path.join(queue_dir, 'running', '{}.{}-{}'.format(
+            i, socket.gethostname(), os.getpid()))
+        try:
+            # Touched first, so requeue_stale does not take the fresh claim
+            # back for the time of the plan
+            os.utime(os.path.join(todo, i))
+            os.rename(os.path.join(todo, i), claim)
+            with open(claim) as f:
+                shard = json.load(f)
+        except FileNotFoundError:
+            continue    # taken by another worker, or requeued
+        shard['claim'] = claim
+        return shard
+    return None
+
+
+def requeue_stale(queue_dir, max_age=3600):
+    """Put running shards whose claim was not touched for more than max_age
+    seconds back in todo (e.g. after a node failed). Returns their ids.
+    """
+    running = os.path.join(queue_dir, 'running')
+    requeued = []
+    for i in os.listdir(running):
+        claim = os.path.join(running, i)
+        if time.time() - os.path.getmtime(claim) > max_age:
+            shard = i.split('.')[0]
+            os.replace(claim, os.path.join(queue_dir, 'todo', shard + '.json'))
+            requeued.append(shard)
+    return requeued
+
+
+def get_progress(queue_dir):
+    """Number of shards in todo, running and done."""
+    return {i: len(os.listdir(os.path.join(queue_dir, i))) for i in QUEUE_DIRS[:3]}
+
+
+def merge_shards(queue_dir, out):
+    """Join the shard tables of a finished sweep into one BehaviorSpace
+    table at out, with the header of the first shard. Raises ValueError if
+    shards are missing. Returns out.
+    """
+    manifest = read_manifest(queue_dir)
+    tables = [os.path.join(queue_dir, 'out', i['shard'] + '.csv') for i in manifest['shards']]
+    missing = [i for i in tables if not os.path.exists(i)]
+    if missing:
+        raise ValueError('{} of {} shards are not done'.format(len(missing), len(tables)))
+
+    tmp = out + '.tmp'
+    with open(tmp, 'w', newline='') as f:
+        for i, table in enumerate(tables):
+            with open(table, newline='') as g:
+                lines = g.readlines()
+            # 6 lines of run information and the column names
+            f.writelines(lines if i == 0 else lines[7:])
+    os.replace(tmp, out)
+    return out
+
+
+def read_manifest(queue_dir):
+    with open(os.path.join(queue_dir, MANIFEST)) as f:
+        return json.load(f)
+
+
+def _touch_claim(claim, stop, interval=HEARTBEAT):
+    """Touch claim every interval seconds until stop is set or the claim is
+    gone (requeued).
+    """
+    while not stop.wait(interval):
+        try:
+            os.utime(claim)
+        except FileNotFoundError:
+            return
+
+
+def _finish_shard(rows, queue_dir, shard, manifest):
+    """Write the shard's table to out and move its claim to done. If the
+    claim is gone, the shard was requeued and runs elsewhere, so the table
+    is discarded. Returns whether the shard was finished here.
+    """
+    table = os.path.join(queue_dir, 'out', shard['shard'] + '.csv')
+    tmp = '{}.{}-{}.tmp'.format(table, socket.gethostname(), os.getpid())
+    write_table(rows, tmp, manifest['experiment']['name'], manifest['model'])
+    try:
+        os.replace(shard['claim'], os.path.join(queue_dir, 'done', shard['shard'] + '.json'))
+    except FileNotFoundError:
+        os.remove(tmp)
+        return False
+    os.replace(tmp, table)
+    return True